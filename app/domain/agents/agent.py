@@ -1,14 +1,56 @@
+import asyncio
+import json
+import os
+import time
 import uuid
 import colorama
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from functools import lru_cache
 from typing import Dict, Any, List
 from colorama import Fore
 from pydantic import BaseModel
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
-
-from app.domain.agents.utils import parse_function_args, run_tool_from_response
-from app.infrastructure.llm import LLM, models
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage
+
+from app.domain.agents.budget import AGENT_TOKEN_BUDGET, TOKEN_BUDGET_ENABLED, fit_to_budget
+from app.domain.agents.context import RunContext
+from app.domain.agents.recovery import TOOL_CALL_RECOVERY_ENABLED, recover_tool_calls
+from app.domain.agents.toolset import ToolSet
+from app.domain.agents.utils import arun_tool_call, run_tool_call
+from app.domain.exceptions import LLMUnavailableError
+from app.infrastructure.llm import llm_deadline, models, resolve_model
+from app.infrastructure.llm_cache import ainvoke_cached, invoke_cached
+from app.infrastructure.model_router import model_router
+from app.infrastructure.tokens import count_tokens, prompt_budget
 from app.domain.tools.tool import Tool, ToolResult
 
+# Pool compartilhado para executar tools somente leitura em paralelo
+TOOL_EXECUTOR_WORKERS = int(os.getenv("TOOL_EXECUTOR_WORKERS", "8"))
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_WORKERS, thread_name_prefix="tool")
+
+
+class FinishPolicy(str, Enum):
+    """Quando a execucao de um Agent termina."""
+    # Somente quando o modelo chama report_tool (comportamento original)
+    REPORT_TOOL = "report_tool"
+    # Tambem aceita uma resposta do assistente sem tool calls como resposta final
+    DIRECT_ANSWER = "direct_answer"
+    # DIRECT_ANSWER + tools com result_template respondem localmente, sem outra chamada ao LLM
+    TEMPLATE = "template"
+
+
+AGENT_FINISH_POLICY = FinishPolicy(os.getenv("AGENT_FINISH_POLICY", FinishPolicy.REPORT_TOOL.value))
+
+# Ocorrencias toleradas da mesma tool call (nome + args) ou do mesmo erro antes de encerrar a execucao
+AGENT_MAX_REPEATS = int(os.getenv("AGENT_MAX_REPEATS", "2"))
+# Tempo maximo de uma execucao do Agent; 0 = sem limite
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", "60"))
+
+BEST_EFFORT_ANSWER = "Sorry, I couldn't complete this request. Please try again or rephrase it."
+
+DIRECT_ANSWER_NOTE = """
+When you already have the final answer for the user, you may reply with it directly as plain text instead of calling report_tool."""
+
 class StepResult(BaseModel):
     event: str
     content: str
@@ -49,244 +91,515 @@ Action: Use query_data_tool → Get results → Use report_tool with summary
 
 {context}"""
 
+def compose_user_input(user_input: str, context: str = None, history: str = None) -> str:
+    """Mensagem do usuario precedida do contexto e da conversa anterior, quando houver."""
+    blocks = [block for block in (context, history and f"Conversation so far:\n{history}") if block]
+    if not blocks:
+        return user_input
+    return "\n---\n\n".join([*blocks, f"User Message: {user_input}"])
+
+@lru_cache(maxsize=128)
+def _system_message(template: str, context: str | None) -> SystemMessage:
+    """SystemMessage formatado uma vez por (template, context) e reaproveitado entre execucoes."""
+    return SystemMessage(content=template.format(context=context))
+
+def _normalize_tool_calls(tool_calls: List[dict]) -> List[dict]:
+    """Garante um id para cada tool call (alguns provedores nao retornam)."""
+    return [
+        {**tc, "id": tc.get("id") or str(uuid.uuid4())}
+        for tc in tool_calls
+    ]
+
+def _execution_groups(tool_calls: List[dict], tools: Dict[str, Tool]) -> List[tuple]:
+    """
+    Divide os tool calls, na ordem do modelo, em (paralelo, indices): cada sequencia
+    de tools somente leitura vira um grupo paralelo; cada escrita (ou tool
+    desconhecida) vira um grupo proprio.
+    """
+    groups = []
+    for index, tool_call in enumerate(tool_calls):
+        read_only = getattr(tools.get(tool_call["name"]), "read_only", False)
+        if read_only and groups and groups[-1][0]:
+            groups[-1][1].append(index)
+        else:
+            groups.append((read_only, [index]))
+    return groups
+
+def convert_to_langchain_messages(messages: List[Dict[str, Any]]) -> List[BaseMessage]:
+    """
+    Converte mensagens do formato OpenAI para LangChain mantendo compatibilidade total.
+    
+    Suporta:
+    - Mensagens system, user, assistant e tool
+    - Tool calls com IDs automáticos quando ausentes
+    - Normalização de argumentos de tool calls
+    - Agrupamento inteligente de tool calls com suas respostas
+    """
+    langchain_messages = []
+    processed_tool_message_ids = set()  # Track tool messages já processadas
+    
+    for i, msg in enumerate(messages):
+        role = msg["role"]
+        content = msg.get("content", "")
+        
+        if role == "system":
+            langchain_messages.append(SystemMessage(content=content))
+            
+        elif role == "user":
+            langchain_messages.append(HumanMessage(content=content))
+            
+        elif role == "assistant":
+            # Verificar se há tool calls
+            tool_calls_data = msg.get("tool_calls")
+            
+            if tool_calls_data:
+                # Processar e normalizar tool calls
+                normalized_tool_calls = []
+                tool_call_ids = []
+                
+                for tc in tool_calls_data:
+                    # Normalizar estrutura do tool call
+                    normalized_tc = {
+                        "name": tc.get("name", tc.get("function", {}).get("name", "")),
+                        "args": tc.get("args", tc.get("arguments", tc.get("function", {}).get("arguments", {}))),
+                        "id": tc.get("id", str(uuid.uuid4())),
+                    }
+                    
+                    # Manter type se existir (compatibilidade)
+                    if "type" in tc:
+                        normalized_tc["type"] = tc["type"]
+                    
+                    normalized_tool_calls.append(normalized_tc)
+                    tool_call_ids.append(normalized_tc["id"])
+                
+                # Criar AIMessage com tool calls
+                langchain_messages.append(AIMessage(
+                    content=content,
+                    tool_calls=normalized_tool_calls
+                ))
+                
+                # Buscar mensagens de tool correspondentes nas próximas mensagens
+                for j in range(i + 1, len(messages)):
+                    next_msg = messages[j]
+                    
+                    if next_msg["role"] == "tool":
+                        tool_call_id = next_msg.get("tool_call_id")
+                        
+                        # Se esta tool message responde a um dos tool calls atuais
+                        if tool_call_id in tool_call_ids and tool_call_id not in processed_tool_message_ids:
+                            langchain_messages.append(ToolMessage(
+                                content=next_msg.get("content", ""),
+                                tool_call_id=tool_call_id
+                            ))
+                            processed_tool_message_ids.add(tool_call_id)
+                    
+                    # Parar se encontrarmos outra mensagem que não seja tool
+                    elif next_msg["role"] != "tool":
+                        break
+            else:
+                # Mensagem normal de assistant sem tool calls
+                langchain_messages.append(AIMessage(content=content))
+                
+        elif role == "tool":
+            # Só processar mensagens de tool que não foram agrupadas com assistant messages
+            tool_call_id = msg.get("tool_call_id")
+            
+            if tool_call_id not in processed_tool_message_ids:
+                # Gerar ID se não existir (fallback para casos edge)
+                if not tool_call_id:
+                    tool_call_id = str(uuid.uuid4())
+                
+                langchain_messages.append(ToolMessage(
+                    content=content,
+                    tool_call_id=tool_call_id
+                ))
+                processed_tool_message_ids.add(tool_call_id)
+    
+    return langchain_messages
+
 class Agent:
 
     def __init__(
             self,
-            tools: List[Tool],
+            tools: List[Tool] | ToolSet,
             system_message: str = SYSTEM_MESSAGE,
             llm: Dict[str, Any] = models,
             max_steps: int = 5,
             verbose: bool = True,
             examples: List[dict] = None,
             context: str = None,
-            user_context: str = None
+            user_context: str = None,
+            langchain_examples: List[BaseMessage] = None,
+            finish_policy: FinishPolicy | str = AGENT_FINISH_POLICY,
+            model: str = "execution",
+            escalation_model: str | None = "escalation",
+            token_budget: int = AGENT_TOKEN_BUDGET,
+            deadline_seconds: float = AGENT_DEADLINE_SECONDS,
     ):
-        self.tools = tools
+        self.toolset = tools if isinstance(tools, ToolSet) else ToolSet(tools)
+        self.tools = self.toolset.tools
         self.llm = llm
         self.system_message = system_message
         self.memory = []
-        self.step_history = []
         self.max_steps = max_steps
         self.verbose = verbose
         self.examples = examples or []
+        # Exemplos convertidos uma unica vez (o TaskAgent repassa a versao ja convertida)
+        self.langchain_examples = (
+            langchain_examples if langchain_examples is not None
+            else convert_to_langchain_messages(self.examples)
+        )
         self.context = context or ""
         self.user_context = user_context
+        self.finish_policy = FinishPolicy(finish_policy)
+        # Tier ou chave de MODEL_CONFIGS; o modelo de escalonamento assume apos uma tool call com falha
+        self.model = resolve_model(model)
+        self.escalation_model = resolve_model(escalation_model)
+        # Teto de tokens do prompt por passo (0 = janela do modelo, ver prompt_budget)
+        self.token_budget = token_budget
+        self.deadline_seconds = deadline_seconds
+        if self.finish_policy != FinishPolicy.REPORT_TOOL and self.system_message:
+            self.system_message = self.system_message + DIRECT_ANSWER_NOTE
 
     def to_console(self, tag: str, message: str, color: str = "green"):
         if self.verbose:
             color_prefix = Fore.__dict__[color.upper()]
             print(color_prefix + f"{tag}: {message}{colorama.Style.RESET_ALL}")
 
-    def run(self, user_input: str, context: str = None):
-        # Converter tools para formato LangChain
-        langchain_tools = [tool.langchain_tool_schema for tool in self.tools]
-        system_message = self.system_message.format(context=context)
+    def run(self, user_input: str, context: str = None, history: str = None):
+        run_context = self.start_run(user_input, context, history)
+        return self.run_steps(run_context)
+
+    async def arun(self, user_input: str, context: str = None, history: str = None):
+        """Versao assincrona de run: aguarda o LLM e as tools sem ocupar uma thread."""
+        run_context = self.start_run(user_input, context, history)
+        return await self.arun_steps(run_context)
+
+    def start_run(self, user_input: str, context: str = None, history: str = None) -> RunContext:
+        """
+        Cria o estado de uma nova execucao; o Agent em si nao guarda estado entre execucoes.
+        history e a conversa anterior do usuario (ver ConversationMemory), ja limitada em tokens.
+        """
+        system_message = _system_message(self.system_message, context)
 
         if self.user_context:
             context = context if context else self.user_context
 
-        if context:
-            user_input = f"{context}\n---\n\nUser Message: {user_input}"
+        user_input = compose_user_input(user_input, context, history)
 
         self.to_console("START", f"Starting Agent with Input:\n'''{user_input}'''")
 
-        self.step_history = [
-            {"role": "system", "content": system_message},
-            *self.examples,
-            {"role": "user", "content": user_input}
-        ]
-
-        step_result = None
-        i = 0
-
-        while i < self.max_steps:
-            step_result = self.run_step(self.step_history, langchain_tools)
-            if step_result.event == "finish":
+        return RunContext(
+            toolset=self.toolset,
+            messages=[
+                system_message,
+                *self.langchain_examples,
+                HumanMessage(content=user_input)
+            ],
+            model=self.model,
+            examples=len(self.langchain_examples),
+        )
+
+    def run_steps(self, run_context: RunContext):
+        final = None
+        while final is None:
+            final = self._out_of_budget(run_context)
+            if final is not None:
                 break
-            elif step_result.event == "error":
-                self.to_console(step_result.event, step_result.content, "red")
-            else:
-                self.to_console(step_result.event, step_result.content, "yellow")
-
-            i += 1
-
-        self.to_console("Final Result", step_result.content, "green")
-        return step_result.content
+            started = time.monotonic()
+            try:
+                # Chamadas ao LLM do passo usam no maximo o tempo que resta (timeout do roteador)
+                with llm_deadline(self._deadline(run_context)):
+                    step_result = self.run_step(run_context)
+            except LLMUnavailableError:
+                if not self._past_deadline(run_context):
+                    raise
+                final = self._deadline_reached(run_context)
+                break
+            run_context.step_seconds.append(time.monotonic() - started)
+            final = self._end_step(run_context, step_result)
 
-    def run_step(self, messages: List[dict], tools):
-        # Converter mensagens para formato LangChain
-        langchain_messages = self._convert_to_langchain_messages(messages)
+        self.to_console("Final Result", final.content, "green")
+        return final.content
 
-        # Bind tools e invocar
-        model = self.llm[LLM]
-        model_with_tools = model.bind_tools(tools)
-        response = model_with_tools.invoke(langchain_messages)
+    async def arun_steps(self, run_context: RunContext):
+        final = None
+        while final is None:
+            final = self._out_of_budget(run_context)
+            if final is not None:
+                break
+            started = time.monotonic()
+            deadline = self._deadline(run_context)
+            try:
+                # O passo inteiro (LLM + tools) termina no deadline
+                with llm_deadline(deadline):
+                    step_result = await asyncio.wait_for(
+                        self.arun_step(run_context), None if deadline is None else deadline - time.monotonic()
+                    )
+            except (asyncio.TimeoutError, LLMUnavailableError):
+                if not self._past_deadline(run_context):
+                    raise
+                final = self._deadline_reached(run_context)
+                break
+            run_context.step_seconds.append(time.monotonic() - started)
+            final = self._end_step(run_context, step_result)
 
-        # Verificar múltiplas tool calls
-        if response.tool_calls and len(response.tool_calls) > 1:
-            messages = [
-                *self.step_history,
-                {"role": "user", "content": "Error: Please return only one tool call at a time."}
-            ]
-            return self.run_step(messages, tools)
+        self.to_console("Final Result", final.content, "green")
+        return final.content
 
-        # Adicionar mensagem do assistente ao histórico
-        assistant_message = {
-            "role": "assistant", 
-            "content": response.content,
-            "tool_calls": response.tool_calls if response.tool_calls else None
-        }
-        self.step_history.append(assistant_message)
-        
-        # Verificar se há tool call
-        if not response.tool_calls:
-            msg = response.content
-            step_result = StepResult(
-                event="error", 
-                content=f"No tool calls were returned.\nMessage: {msg}", 
-                success=False
-            )
+    def _end_step(self, run_context: RunContext, step_result: StepResult) -> StepResult | None:
+        """Registra o passo no console; retorna o resultado final quando a execucao terminou."""
+        if step_result.event == "finish":
             return step_result
+        elif step_result.event in ("error", "loop"):
+            self.to_console(step_result.event, step_result.content, "red")
+        else:
+            self.to_console(step_result.event, step_result.content, "yellow")
+
+        run_context.steps += 1
+        if step_result.event == "loop":
+            return self._give_up(run_context, step_result.content)
+        if step_result.event == "error":
+            # "No tool calls were returned." ou "Missing values: x": a primeira linha identifica o erro
+            error = step_result.content.splitlines()[0] if step_result.content else ""
+            run_context.error_counts[error] += 1
+            if run_context.error_counts[error] > AGENT_MAX_REPEATS:
+                return self._give_up(run_context, f"Repeated error: {error}")
+        return None
+
+    def _out_of_budget(self, run_context: RunContext) -> StepResult | None:
+        """Encerra antes de um passo que passaria de max_steps ou do deadline (pela duracao media dos passos)."""
+        if run_context.steps >= self.max_steps:
+            return self._give_up(run_context, f"Reached max steps ({self.max_steps})")
+        if self.deadline_seconds:
+            elapsed = time.monotonic() - run_context.started_at
+            steps = run_context.step_seconds
+            expected = sum(steps) / len(steps) if steps else 0.0
+            if elapsed + expected > self.deadline_seconds:
+                return self._deadline_reached(run_context)
+        return None
+
+    def _deadline(self, run_context: RunContext) -> float | None:
+        """Instante (time.monotonic()) em que a execucao tem que terminar, ou None sem deadline."""
+        return run_context.started_at + self.deadline_seconds if self.deadline_seconds else None
+
+    def _past_deadline(self, run_context: RunContext) -> bool:
+        deadline = self._deadline(run_context)
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _deadline_reached(self, run_context: RunContext) -> StepResult:
+        elapsed = time.monotonic() - run_context.started_at
+        return self._give_up(run_context, f"Deadline of {self.deadline_seconds:.0f}s (elapsed {elapsed:.1f}s)")
+
+    def _give_up(self, run_context: RunContext, reason: str) -> StepResult:
+        """Resposta possivel sem mais chamadas ao LLM: ultimo resultado de tool, ultimo texto ou aviso."""
+        self.to_console("STOP", reason, "red")
+        run_context.gave_up = True
+        content = run_context.last_tool_output or run_context.last_text or BEST_EFFORT_ANSWER
+        return StepResult(event="finish", content=content, success=False)
+
+    def _repeated_call(self, run_context: RunContext, tool_calls: List[dict]) -> str | None:
+        """Conta cada (tool, args); retorna a chamada que passou de AGENT_MAX_REPEATS."""
+        for tool_call in tool_calls:
+            signature = f"{tool_call['name']}({json.dumps(tool_call['args'], sort_keys=True, default=str)})"
+            run_context.call_counts[signature] += 1
+            if run_context.call_counts[signature] > AGENT_MAX_REPEATS:
+                return signature
+        return None
+
+    def run_step(self, run_context: RunContext):
+        # Modelo com as tools vinculadas, com failover entre LLM e LLM_FALLBACKS
+        model_with_tools = model_router.bind(run_context.toolset, self.llm, run_context.model)
+        response = invoke_cached(
+            model_with_tools, self._prompt_messages(run_context), self.llm, run_context.model,
+            run_context.toolset.schemas, use_cache=not run_context.wrote,
+        )
+
+        tool_calls = self._record_response(run_context, response)
+        if not tool_calls:
+            return self._no_tool_calls_result(run_context, response)
+        repeated = self._repeated_call(run_context, tool_calls)
+        if repeated:
+            return StepResult(event="loop", content=f"Repeated tool call: {repeated}", success=False)
+
+        # Executar as tools (somente leitura em paralelo) e devolver todos os resultados de uma vez
+        tool_results = self.execute_tool_calls(tool_calls, run_context.toolset)
+        return self._record_tool_results(run_context, tool_calls, tool_results)
+
+    async def arun_step(self, run_context: RunContext):
+        model_with_tools = model_router.bind(run_context.toolset, self.llm, run_context.model)
+        response = await ainvoke_cached(
+            model_with_tools, self._prompt_messages(run_context), self.llm, run_context.model,
+            run_context.toolset.schemas, use_cache=not run_context.wrote,
+        )
+
+        tool_calls = self._record_response(run_context, response)
+        if not tool_calls:
+            return self._no_tool_calls_result(run_context, response)
+        repeated = self._repeated_call(run_context, tool_calls)
+        if repeated:
+            return StepResult(event="loop", content=f"Repeated tool call: {repeated}", success=False)
+
+        tool_results = await self.aexecute_tool_calls(tool_calls, run_context.toolset)
+        return self._record_tool_results(run_context, tool_calls, tool_results)
+
+    def _prompt_messages(self, run_context: RunContext) -> List[BaseMessage]:
+        """Historico enviado ao LLM neste passo, dentro do budget de tokens do modelo atual."""
+        if TOKEN_BUDGET_ENABLED:
+            budget = prompt_budget(self.llm, run_context.model, self.token_budget)
+            messages, tokens = fit_to_budget(
+                run_context.messages, run_context.examples, budget, counts=run_context.token_counts
+            )
+        else:
+            budget, messages = None, run_context.messages
+            tokens = count_tokens(messages)
+        run_context.prompt_tokens.append(tokens)
+        self.to_console("Prompt Tokens", f"{tokens}" + (f" (budget {budget})" if budget else ""), "cyan")
+        return messages
+
+    def _record_response(self, run_context: RunContext, response: AIMessage) -> List[dict]:
+        content = response.content
+        tool_calls = _normalize_tool_calls(response.tool_calls)
+        if not tool_calls and TOOL_CALL_RECOVERY_ENABLED:
+            # Tool call escrito como texto: executa direto em vez de pedir de novo ao LLM
+            tool_calls = recover_tool_calls(content, run_context.toolset, run_context.model)
+            if tool_calls:
+                self.to_console("RECOVERED", f"{len(tool_calls)} tool call(s) from text", "magenta")
+                content = ""
 
-        # Extrair informações da tool
-        tool_call = response.tool_calls[0]
-        tool_name = tool_call["name"]
-        tool_kwargs = parse_function_args(response)
+        # Adicionar mensagem do assistente ao histórico
+        run_context.messages.append(AIMessage(content=content, tool_calls=tool_calls))
+        if isinstance(content, str) and content.strip():
+            run_context.last_text = content
+
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.to_console("Usage", f"input={usage.get('input_tokens')} output={usage.get('output_tokens')}", "cyan")
+
+        for tool_call in tool_calls:
+            self.to_console("Tool Call", f"Name: {tool_call['name']}\nArgs: {tool_call['args']}\nMessage: {response.content}", "magenta")
+        return tool_calls
+
+    def _no_tool_calls_result(self, run_context: RunContext, response: AIMessage) -> StepResult:
+        msg = response.content
+        if self.finish_policy != FinishPolicy.REPORT_TOOL and isinstance(msg, str) and msg.strip():
+            # Resposta em texto puro e a resposta final: nao gasta outro passo
+            return StepResult(event="finish", content=msg, success=True)
+
+        step_result = StepResult(
+            event="error", 
+            content=f"No tool calls were returned.\nMessage: {msg}", 
+            success=False
+        )
+        self._escalate(run_context)
+        return step_result
 
-        self.to_console("Tool Call", f"Name: {tool_name}\nArgs: {tool_kwargs}\nMessage: {response.content}", "magenta")
-        tool_result = run_tool_from_response(response, tools=self.tools)
-        
-        # Extrair informações do response para criar a mensagem de tool
-        tool_call_info = {
-            "id": response.tool_calls[0]["id"],
-            "name": response.tool_calls[0]["name"]
-        }
-        tool_result_msg = self.tool_call_message_langchain(tool_call_info, tool_result)
-        self.step_history.append(tool_result_msg)
+    def _record_tool_results(self, run_context: RunContext, tool_calls: List[dict], tool_results: List[ToolResult]) -> StepResult:
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            run_context.messages.append(self.tool_call_message_langchain(tool_call, tool_result))
+            tool = run_context.toolset.by_name.get(tool_call["name"])
+            if not getattr(tool, "read_only", False):
+                run_context.wrote = True
+            if tool_result.success and tool_call["name"] != "report_tool":
+                run_context.last_tool_output = tool_result.content
 
         # Verificar se é report_tool para finalizar
-        if tool_name == "report_tool":
-            step_result = StepResult(
-                event="finish",
-                content=tool_result.content,
-                success=True
-            )
-            return step_result
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            if tool_call["name"] == "report_tool":
+                step_result = StepResult(
+                    event="finish",
+                    content=tool_result.content,
+                    success=True
+                )
+                return step_result
+
+        if self.finish_policy == FinishPolicy.TEMPLATE:
+            rendered = self._render_results(run_context.toolset, tool_calls, tool_results)
+            if rendered is not None:
+                return StepResult(event="finish", content=rendered, success=True)
+
+        # Processar resultado da(s) tool(s)
+        if len(tool_results) == 1:
+            content = tool_results[0].content
+        else:
+            content = "\n".join(f"{tc['name']}: {tr.content}" for tc, tr in zip(tool_calls, tool_results))
 
-        # Processar resultado da tool
-        if tool_result.success:
+        if all(tool_result.success for tool_result in tool_results):
             step_result = StepResult(
                 event="tool_result",
-                content=tool_result.content,
+                content=content,
                 success=True
             )
         else:
             step_result = StepResult(
                 event="error",
-                content=tool_result.content,
+                content=content,
                 success=False
             )
+            # Tool falhou ou argumentos invalidos: os proximos passos usam o modelo mais forte
+            self._escalate(run_context)
 
         return step_result
 
-    def tool_call_message_langchain(self, tool_call: dict, tool_result: ToolResult):
+    def _escalate(self, run_context: RunContext):
+        if self.escalation_model and run_context.model != self.escalation_model:
+            self.to_console("ESCALATE", f"{run_context.model} -> {self.escalation_model}", "red")
+            run_context.model = self.escalation_model
+
+    def _render_results(self, toolset: ToolSet, tool_calls: List[dict], tool_results: List[ToolResult]) -> str | None:
+        """Resposta final a partir dos result_template, se todas as tools do passo tiverem um."""
+        rendered = []
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            tool = toolset.by_name.get(tool_call["name"])
+            text = tool.render_result(tool_call["args"], tool_result) if hasattr(tool, "render_result") else None
+            if text is None:
+                return None
+            rendered.append(text)
+        return "\n".join(rendered)
+
+    def execute_tool_calls(self, tool_calls: List[dict], toolset: ToolSet) -> List[ToolResult]:
+        """
+        Executa os tool calls de uma resposta, preservando a ordem dos resultados.
+        Cada sequencia de tools somente leitura roda em paralelo no pool e termina
+        antes da escrita seguinte; escritas rodam uma a uma, na ordem pedida pelo
+        modelo (uma leitura listada depois de uma escrita ve o que ela gravou).
+        """
+        tools = toolset.by_name
+        if len(tool_calls) == 1:
+            return [run_tool_call(tool_calls[0], tools)]
+
+        results: List[Any] = [None] * len(tool_calls)
+        for parallel, indexes in _execution_groups(tool_calls, tools):
+            if not parallel:
+                results[indexes[0]] = run_tool_call(tool_calls[indexes[0]], tools)
+                continue
+            futures = {index: _tool_executor.submit(run_tool_call, tool_calls[index], tools) for index in indexes}
+            for index, future in futures.items():
+                results[index] = future.result()
+        return results
+
+    async def aexecute_tool_calls(self, tool_calls: List[dict], toolset: ToolSet) -> List[ToolResult]:
+        """Mesma politica de execute_tool_calls usando os _arun das tools."""
+        tools = toolset.by_name
+        results: List[Any] = [None] * len(tool_calls)
+        for parallel, indexes in _execution_groups(tool_calls, tools):
+            if not parallel:
+                results[indexes[0]] = await arun_tool_call(tool_calls[indexes[0]], tools)
+                continue
+            group = await asyncio.gather(*(arun_tool_call(tool_calls[index], tools) for index in indexes))
+            for index, result in zip(indexes, group):
+                results[index] = result
+        return results
+
+    def tool_call_message_langchain(self, tool_call: dict, tool_result: ToolResult) -> ToolMessage:
         """Cria mensagem de resposta da tool para LangChain."""
-        return {
-            "tool_call_id": tool_call.get("id", "unknown"),
-            "role": "tool",
-            "name": tool_call["name"],
-            "content": tool_result.content,
-        }
+        return ToolMessage(
+            content=tool_result.content,
+            tool_call_id=tool_call.get("id", "unknown"),
+            name=tool_call["name"],
+        )
 
     def _convert_to_langchain_messages(self, messages: List[Dict[str, Any]]):
-        """
-        Converte mensagens do formato OpenAI para LangChain mantendo compatibilidade total.
-        
-        Suporta:
-        - Mensagens system, user, assistant e tool
-        - Tool calls com IDs automáticos quando ausentes
-        - Normalização de argumentos de tool calls
-        - Agrupamento inteligente de tool calls com suas respostas
-        """
-        langchain_messages = []
-        processed_tool_message_ids = set()  # Track tool messages já processadas
-        
-        for i, msg in enumerate(messages):
-            role = msg["role"]
-            content = msg.get("content", "")
-            
-            if role == "system":
-                langchain_messages.append(SystemMessage(content=content))
-                
-            elif role == "user":
-                langchain_messages.append(HumanMessage(content=content))
-                
-            elif role == "assistant":
-                # Verificar se há tool calls
-                tool_calls_data = msg.get("tool_calls")
-                
-                if tool_calls_data:
-                    # Processar e normalizar tool calls
-                    normalized_tool_calls = []
-                    tool_call_ids = []
-                    
-                    for tc in tool_calls_data:
-                        # Normalizar estrutura do tool call
-                        normalized_tc = {
-                            "name": tc.get("name", tc.get("function", {}).get("name", "")),
-                            "args": tc.get("args", tc.get("arguments", tc.get("function", {}).get("arguments", {}))),
-                            "id": tc.get("id", str(uuid.uuid4())),
-                        }
-                        
-                        # Manter type se existir (compatibilidade)
-                        if "type" in tc:
-                            normalized_tc["type"] = tc["type"]
-                        
-                        normalized_tool_calls.append(normalized_tc)
-                        tool_call_ids.append(normalized_tc["id"])
-                    
-                    # Criar AIMessage com tool calls
-                    langchain_messages.append(AIMessage(
-                        content=content,
-                        tool_calls=normalized_tool_calls
-                    ))
-                    
-                    # Buscar mensagens de tool correspondentes nas próximas mensagens
-                    for j in range(i + 1, len(messages)):
-                        next_msg = messages[j]
-                        
-                        if next_msg["role"] == "tool":
-                            tool_call_id = next_msg.get("tool_call_id")
-                            
-                            # Se esta tool message responde a um dos tool calls atuais
-                            if tool_call_id in tool_call_ids and tool_call_id not in processed_tool_message_ids:
-                                langchain_messages.append(ToolMessage(
-                                    content=next_msg.get("content", ""),
-                                    tool_call_id=tool_call_id
-                                ))
-                                processed_tool_message_ids.add(tool_call_id)
-                        
-                        # Parar se encontrarmos outra mensagem que não seja tool
-                        elif next_msg["role"] != "tool":
-                            break
-                else:
-                    # Mensagem normal de assistant sem tool calls
-                    langchain_messages.append(AIMessage(content=content))
-                    
-            elif role == "tool":
-                # Só processar mensagens de tool que não foram agrupadas com assistant messages
-                tool_call_id = msg.get("tool_call_id")
-                
-                if tool_call_id not in processed_tool_message_ids:
-                    # Gerar ID se não existir (fallback para casos edge)
-                    if not tool_call_id:
-                        tool_call_id = str(uuid.uuid4())
-                    
-                    langchain_messages.append(ToolMessage(
-                        content=content,
-                        tool_call_id=tool_call_id
-                    ))
-                    processed_tool_message_ids.add(tool_call_id)
-        
-        return langchain_messages
\ No newline at end of file
+        """Mantido para compatibilidade - ver convert_to_langchain_messages."""
+        return convert_to_langchain_messages(messages)
+
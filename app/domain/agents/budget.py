@@ -0,0 +1,102 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from app.infrastructure.tokens import MESSAGE_OVERHEAD, Tokenizer, count_message_tokens, get_tokenizer
+
+TOKEN_BUDGET_ENABLED = os.getenv("TOKEN_BUDGET_ENABLED", "true").lower() == "true"
+# Teto de tokens do prompt por passo; 0 = janela do modelo menos a reserva da resposta
+AGENT_TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET", "0"))
+# Tamanho maximo de um resultado de tool de passos anteriores quando o prompt nao cabe
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "500"))
+
+
+def fit_to_budget(
+        messages: List[BaseMessage],
+        examples: int,
+        budget: int,
+        counter: Tokenizer = None,
+        counts: Optional[Dict[int, int]] = None,
+) -> Tuple[List[BaseMessage], int]:
+    """
+    Versao do historico que cabe em budget tokens, sem alterar o original.
+
+    messages segue o formato do Agent: [system, *exemplos, pergunta, *passos].
+    Enquanto o prompt passar do budget, em ordem:
+    1. resultados de tools de passos anteriores sao cortados em TOOL_RESULT_MAX_TOKENS;
+    2. exemplos few-shot sao removidos, do ultimo para o primeiro, um dialogo inteiro por vez;
+    3. resultados de tools do ultimo passo sao cortados no que sobrar do budget.
+
+    counts guarda a contagem por mensagem (id) entre passos da mesma execucao.
+    Retorna (mensagens, tokens do prompt).
+    """
+    counter = counter or get_tokenizer()
+    counts = {} if counts is None else counts
+    messages = list(messages)
+
+    def cost(message: BaseMessage) -> int:
+        key = id(message)
+        if key not in counts:
+            counts[key] = count_message_tokens(message, counter)
+        return counts[key]
+
+    total = sum(cost(message) for message in messages)
+    if total <= budget:
+        return messages, total
+
+    history_start = 1 + examples + 1
+    last_response = max(
+        (index for index in range(history_start, len(messages)) if isinstance(messages[index], AIMessage)),
+        default=len(messages),
+    )
+
+    # 1. Resultados antigos: o modelo ja os usou para decidir o passo seguinte
+    for index in range(history_start, last_response):
+        if total <= budget:
+            return messages, total
+        total -= _truncate_at(messages, index, TOOL_RESULT_MAX_TOKENS, counter, cost)
+
+    # 2. Exemplos few-shot, um dialogo (pergunta + chamadas + resultados) por vez
+    groups = _example_groups(messages[1:1 + examples])
+    removed = 0
+    while total > budget and groups:
+        start, end = groups.pop()
+        total -= sum(cost(message) for message in messages[1 + start:1 + end])
+        removed += end - start
+    if removed:
+        messages = [messages[0], *messages[1:1 + examples - removed], *messages[1 + examples:]]
+        last_response -= removed
+
+    # 3. Resultados do ultimo passo, divididos igualmente no espaco restante
+    recent = [index for index in range(last_response, len(messages)) if isinstance(messages[index], ToolMessage)]
+    if total > budget and recent:
+        available = budget - (total - sum(cost(messages[index]) for index in recent))
+        share = max(1, available // len(recent) - MESSAGE_OVERHEAD)
+        for index in recent:
+            total -= _truncate_at(messages, index, share, counter, cost)
+    return messages, total
+
+
+def _truncate_at(messages: List[BaseMessage], index: int, max_tokens: int, counter: Tokenizer, cost) -> int:
+    """Corta o ToolMessage em messages[index]; retorna quantos tokens foram economizados."""
+    message = messages[index]
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return 0
+    tokens = counter.count(message.content)
+    if tokens <= max_tokens:
+        return 0
+    marker = f"\n... [truncated {tokens - max_tokens} tokens]"
+    content = counter.truncate(message.content, max(0, max_tokens - counter.count(marker))) + marker
+    truncated = message.model_copy(update={"content": content})
+    messages[index] = truncated
+    # A copia e descartada apos o passo: nao entra no cache por id
+    return cost(message) - count_message_tokens(truncated, counter)
+
+
+def _example_groups(examples: List[BaseMessage]) -> List[Tuple[int, int]]:
+    """Intervalos [inicio, fim) de cada dialogo de exemplo (comeca em uma HumanMessage)."""
+    starts = [index for index, message in enumerate(examples) if isinstance(message, HumanMessage)]
+    if not starts or starts[0] != 0:
+        starts = [0, *starts]
+    return [(start, end) for start, end in zip(starts, [*starts[1:], len(examples)])]
@@ -0,0 +1,45 @@
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from app.domain.agents.toolset import ToolSet
+
+
+class RunContext:
+    """
+    Estado de uma unica execucao de um Agent (historico, contador de passos e
+    tools disponiveis).
+
+    As definicoes dos agentes (Agent, TaskAgent, RoutingAgent) ficam imutaveis
+    durante a execucao; tudo que muda a cada passo vive aqui. Cada conversa
+    recebe o seu proprio RunContext, entao varias podem rodar em paralelo
+    (threads ou corrotinas) sem locks.
+    """
+
+    def __init__(self, toolset: ToolSet, messages: List[BaseMessage], model: Optional[str] = None,
+                 examples: int = 0):
+        self.toolset = toolset
+        # Chave de MODEL_CONFIGS usada nos proximos passos (muda quando a execucao escala)
+        self.model = model
+        # Log append-only de mensagens LangChain da execucao
+        self.messages = messages
+        self.steps = 0
+        # True depois que uma tool de escrita rodou: respostas seguintes nao usam o cache do LLM
+        self.wrote = False
+        # Quantas mensagens apos o system prompt sao exemplos few-shot (podem ser cortados)
+        self.examples = examples
+        # Tokens estimados do prompt de cada passo e cache de contagem por mensagem
+        self.prompt_tokens: List[int] = []
+        self.token_counts: Dict[int, int] = {}
+        # Deteccao de loops: quantas vezes cada (tool, args) e cada erro apareceram
+        self.started_at = time.monotonic()
+        self.step_seconds: List[float] = []
+        self.call_counts: Counter = Counter()
+        self.error_counts: Counter = Counter()
+        # Melhor resposta disponivel se a execucao for interrompida
+        self.last_tool_output: Optional[str] = None
+        self.last_text: Optional[str] = None
+        # True quando a execucao foi interrompida (loop, deadline, max_steps): a resposta e so a melhor possivel
+        self.gave_up = False
@@ -0,0 +1,115 @@
+from typing import Any, Dict, Optional
+
+import colorama
+
+from app.infrastructure.llm import models
+from app.domain.agents.prerouter import (
+    PRE_ROUTER_ENABLED, ROUTING_LOG_PATH, TfidfPreRouter, read_routing_decisions,
+)
+from app.domain.agents.routing import ROUTING_FLATTEN, RoutingAgent
+
+SYSTEM_MESSAGE = """You are a helpful assistant.
+Role: You are an AI Assistant designed to serve as the primary point of contact for users interacting through a chat interface.
+Your primary role is to understand users' requests related to database operations and route these requests to the appropriate tool.
+
+Capabilities:
+You have access to a variety of tools designed for Create, Read operations on a set of predefined tables in a database, grouped by domain.
+
+Domains:
+{domains}
+"""
+
+
+class DomainDispatcher:
+    """
+    Ponto de entrada unico sobre varios dominios (finance, relationships, ...).
+
+    1. Um classificador local (TF-IDF sobre os TaskAgents de cada dominio)
+       escolhe o dominio quando a intencao e obvia e delega para o RoutingAgent dele.
+    2. Caso contrario, um RoutingAgent "achatado" com os TaskAgents de todos os
+       dominios escolhe o agente em uma unica chamada ao LLM.
+
+    Assim, adicionar dominios nao adiciona uma chamada sequencial ao LLM por mensagem.
+    """
+
+    def __init__(
+            self,
+            domains: Dict[str, RoutingAgent],
+            llm: Dict[str, Any] = models,
+            system_message: str = SYSTEM_MESSAGE,
+            verbose: bool = True,
+            classifier: Optional[TfidfPreRouter] = None,
+            use_classifier: bool = PRE_ROUTER_ENABLED,
+            flatten: bool = ROUTING_FLATTEN,
+    ):
+        self.domains = dict(domains)
+        self.verbose = verbose
+
+        task_agents = [agent for domain in self.domains.values() for agent in domain.tools]
+        names = [agent.name for agent in task_agents]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise ValueError(f"TaskAgent names must be unique across domains: {duplicated}")
+        self._domain_by_agent = {
+            agent.name: name for name, domain in self.domains.items() for agent in domain.tools
+        }
+
+        self.classifier = None
+        if use_classifier:
+            self.classifier = classifier or self._build_classifier()
+
+        self.router = RoutingAgent(
+            tools=task_agents,
+            llm=llm,
+            system_message=system_message,
+            verbose=verbose,
+            prompt_extra={"domains": self._describe_domains()},
+            flatten=flatten,
+        )
+
+    def run(self, user_input: str, employee_id: int = None, **kwargs):
+        domain = self._classify(user_input)
+        if domain is not None:
+            return domain.run(user_input, employee_id, **kwargs)
+        return self.router.run(user_input, employee_id, **kwargs)
+
+    async def arun(self, user_input: str, employee_id: int = None, **kwargs):
+        domain = self._classify(user_input)
+        if domain is not None:
+            return await domain.arun(user_input, employee_id, **kwargs)
+        return await self.router.arun(user_input, employee_id, **kwargs)
+
+    def _classify(self, user_input: str) -> Optional[RoutingAgent]:
+        if self.classifier is None:
+            return None
+        prediction = self.classifier.route(user_input)
+        if prediction is None:
+            return None
+        self.to_console("DOMAIN", f"{prediction.label} (score={prediction.score:.2f}, margin={prediction.margin:.2f})")
+        return self.domains[prediction.label]
+
+    def _build_classifier(self) -> TfidfPreRouter:
+        classifier = TfidfPreRouter()
+        for name, domain in self.domains.items():
+            for agent in domain.tools:
+                classifier.add_agent(agent, label=name)
+        if ROUTING_LOG_PATH:
+            # Decisoes registradas sao por TaskAgent; aqui viram exemplos do dominio
+            classifier.train(
+                (text, self._domain_by_agent[label])
+                for text, label in read_routing_decisions(ROUTING_LOG_PATH)
+                if label in self._domain_by_agent
+            )
+        return classifier
+
+    def _describe_domains(self) -> str:
+        lines = []
+        for name, domain in self.domains.items():
+            extra = "; ".join(f"{key}: {value}" for key, value in domain.prompt_extra.items())
+            lines.append(f"- {name}" + (f" ({extra})" if extra else ""))
+        return "\n".join(lines)
+
+    def to_console(self, tag: str, message: str, color: str = "green"):
+        if self.verbose:
+            color_prefix = colorama.Fore.__dict__[color.upper()]
+            print(color_prefix + f"{tag}: {message}{colorama.Style.RESET_ALL}")
@@ -0,0 +1,195 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+# Similaridade minima (cosseno) e distancia minima para o segundo colocado
+PRE_ROUTER_ENABLED = os.getenv("PRE_ROUTER_ENABLED", "true").lower() == "true"
+PRE_ROUTER_THRESHOLD = float(os.getenv("PRE_ROUTER_THRESHOLD", "0.5"))
+PRE_ROUTER_MARGIN = float(os.getenv("PRE_ROUTER_MARGIN", "0.1"))
+# Arquivo JSONL com decisoes do roteador LLM ({"text": ..., "label": ...}) usado para treinar
+ROUTING_LOG_PATH = os.getenv("ROUTING_LOG_PATH")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = {
+    # en
+    "a", "an", "the", "to", "of", "for", "in", "on", "and", "or", "is", "are", "am", "be", "my", "me", "i",
+    "you", "your", "it", "that", "this", "can", "with", "from", "please", "agent", "database", "do", "does",
+    # pt
+    "o", "os", "as", "um", "uma", "de", "do", "da", "dos", "das", "e", "em", "no", "na", "meu", "minha",
+    "meus", "minhas", "para", "por", "com", "que", "eu", "favor",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados: minusculos, sem stopwords e sem o plural simples ("expenses" -> "expense")."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower().replace("_", " ")):
+        if token in _STOPWORDS:
+            continue
+        # Valores e datas nao indicam intencao ("add expense 30 lunch")
+        if len(token) < 2 or token.isdigit():
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class RoutingPrediction(BaseModel):
+    label: str
+    score: float
+    margin: float
+
+
+class TfidfPreRouter:
+    """
+    Classificador local (TF-IDF + cosseno) que escolhe o TaskAgent sem chamar o LLM
+    quando a intencao e obvia ("add expense 30 lunch", "who are my contacts").
+
+    Textos de treino de cada label (nome do TaskAgent): nome, description, cada
+    keyword e routing_example do agente, mais as decisoes do roteador LLM
+    registradas em ROUTING_LOG_PATH. O score de um label e a fracao do peso
+    TF-IDF da mensagem coberta pelo vocabulario dele, com cada palavra valendo
+    o seu maior peso entre os textos do label.
+    """
+
+    def __init__(self, threshold: float = PRE_ROUTER_THRESHOLD, margin: float = PRE_ROUTER_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self._documents: List[Tuple[str, List[str]]] = []
+        self._idf: Dict[str, float] = {}
+        # label -> {token: maior peso do token entre os textos do label}
+        self._profiles: Dict[str, Dict[str, float]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_task_agents(cls, agents: Iterable, **kwargs) -> "TfidfPreRouter":
+        router = cls(**kwargs)
+        for agent in agents:
+            router.add_agent(agent)
+        return router
+
+    def add_agent(self, agent, label: Optional[str] = None):
+        """Adiciona os textos de um TaskAgent; label permite agrupa-los (ex.: por dominio)."""
+        label = label or agent.name
+        self.add_example(label, agent.name)
+        self.add_example(label, agent.description)
+        for keyword in getattr(agent, "keywords", None) or []:
+            self.add_example(label, keyword)
+        for example in getattr(agent, "routing_example", None) or []:
+            if example.get("role") == "user":
+                self.add_example(label, example["content"])
+
+    @property
+    def labels(self) -> List[str]:
+        return sorted({label for label, _ in self._documents})
+
+    def add_example(self, label: str, text: str):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        with self._lock:
+            self._documents.append((label, tokens))
+            self._dirty = True
+
+    def train(self, decisions: Iterable[Tuple[str, str]]):
+        """Treina com pares (texto, label), por exemplo decisoes registradas do roteador LLM."""
+        known = set(self.labels)
+        for text, label in decisions:
+            # Ignora labels que nao existem mais neste roteador
+            if label in known:
+                self.add_example(label, text)
+
+    def load_decisions(self, path: Union[str, Path]) -> int:
+        decisions = read_routing_decisions(path)
+        self.train(decisions)
+        return len(decisions)
+
+    def predict(self, text: str) -> Optional[RoutingPrediction]:
+        self._fit()
+        counts = Counter(tokenize(text))
+        if not any(token in self._idf for token in counts):
+            return None
+        # Palavras desconhecidas (nomes, descricoes) entram com o menor idf possivel:
+        # diluem o score sem apagar a intencao ("add expense 30 lunch")
+        weights = {token: (1 + math.log(count)) * self._idf.get(token, 1.0) for token, count in counts.items()}
+        total = sum(weights.values())
+
+        scores = sorted(
+            ((sum(weight * profile.get(token, 0.0) for token, weight in weights.items()) / total, label)
+             for label, profile in self._profiles.items()),
+            reverse=True,
+        )
+        if not scores:
+            return None
+        best_score, best_label = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        return RoutingPrediction(label=best_label, score=best_score, margin=best_score - runner_up)
+
+    def route(self, text: str) -> Optional[RoutingPrediction]:
+        """Retorna a previsao apenas quando a confianca passa do threshold e da margem."""
+        prediction = self.predict(text)
+        if prediction and prediction.score >= self.threshold and prediction.margin >= self.margin:
+            return prediction
+        return None
+
+    def _fit(self):
+        if not self._dirty:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            document_frequency = Counter()
+            for _, tokens in self._documents:
+                document_frequency.update(set(tokens))
+            total = len(self._documents)
+            self._idf = {token: math.log((1 + total) / (1 + df)) + 1 for token, df in document_frequency.items()}
+            profiles: Dict[str, Dict[str, float]] = {}
+            for label, tokens in self._documents:
+                profile = profiles.setdefault(label, {})
+                for token, weight in self._vectorize(Counter(tokens)).items():
+                    profile[token] = max(profile.get(token, 0.0), weight)
+            self._profiles = profiles
+            self._dirty = False
+
+    def _vectorize(self, counts: Counter) -> Dict[str, float]:
+        return _normalize({token: (1 + math.log(count)) * self._idf[token] for token, count in counts.items()})
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if not norm:
+        return {}
+    return {token: weight / norm for token, weight in vector.items()}
+
+
+def read_routing_decisions(path: Union[str, Path]) -> List[Tuple[str, str]]:
+    """Le os pares (texto, label) gravados por log_routing_decision."""
+    path = Path(path)
+    if not path.exists():
+        return []
+    decisions = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+                decisions.append((record["text"], record["label"]))
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return decisions
+
+
+def log_routing_decision(text: str, label: str, path: Union[str, Path, None] = ROUTING_LOG_PATH):
+    """Registra uma decisao do roteador LLM para treinar o pre-roteador depois."""
+    if not path:
+        return
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps({"text": text, "label": label}, ensure_ascii=False) + "\n")
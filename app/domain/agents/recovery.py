@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.domain.agents.toolset import ToolSet
+
+# Recupera tool calls escritos como texto no content (comum em llama3-8b e gpt-3.5-turbo)
+TOOL_CALL_RECOVERY_ENABLED = os.getenv("TOOL_CALL_RECOVERY_ENABLED", "true").lower() == "true"
+
+# <function=name>{...}</function> (formato nativo do llama 3)
+_FUNCTION_TAG_RE = re.compile(r"<function=([\w.-]+)>\s*(\{.*?\})\s*</function>", re.DOTALL)
+# name({...}) ou name(a=1, b="x")
+_CALL_RE = re.compile(r"\b([A-Za-z_]\w*)\s*\((.*?)\)", re.DOTALL)
+# Trechos isolados do texto: blocos ```...``` e <tag>...</tag>
+# (a linguagem so conta se vier seguida de quebra de linha: ```add(x=1)``` e uma chamada)
+_FENCE_RE = re.compile(r"```(?:[\w-]+[ \t]*\n)?\s*(.*?)```", re.DOTALL)
+_TAG_RE = re.compile(r"<([\w-]+)>(.*?)</\1>", re.DOTALL)
+# O que pode separar chamadas seguidas (name(...), JSON ou <function=...>)
+_CALL_SEPARATOR_RE = re.compile(r"[\s,;]*")
+_KWARG_RE = re.compile(r"""\s*(\w+)\s*=\s*("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[^,]+)\s*(?:,|$)""")
+
+_JSON_TYPES = {
+    "string": str,
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+_stats: Dict[str, Counter] = {}
+_stats_lock = threading.Lock()
+
+
+def recover_tool_calls(content: Any, toolset: ToolSet, model_key: str = "") -> List[dict]:
+    """
+    Tool calls escritos no texto da resposta, no formato de AIMessage.tool_calls.
+
+    Aceita JSON ({"name": ..., "arguments": {...}}, {"function": {...}}, listas),
+    <function=name>{...}</function> e chamadas no estilo name({...}) / name(a=1),
+    desde que formem a mensagem inteira ou o corpo de um bloco ```/<tag>
+    (ex.: <tool_call>...</tool_call>). So retorna chamadas cujo nome, argumentos
+    e campos obrigatorios batem com as tools vinculadas; caso contrario, [].
+    """
+    if not isinstance(content, str) or not content.strip():
+        return []
+    candidates = list(_candidates(content, toolset))
+    if not candidates:
+        return []
+
+    _count(model_key, "attempts")
+    # Uma chamada invalida invalida a resposta inteira: nada e executado pela metade
+    if not all(_matches_schema(call, toolset) for call in candidates):
+        _count(model_key, "rejected")
+        return []
+    _count(model_key, "recovered")
+    return [
+        {"name": call["name"], "args": call["args"], "id": str(uuid.uuid4()), "type": "tool_call"}
+        for call in candidates
+    ]
+
+
+def recovery_stats() -> Dict[str, Dict[str, int]]:
+    """Por modelo: respostas com tool call em texto (attempts), executadas (recovered) e descartadas (rejected)."""
+    return {model: dict(counter) for model, counter in _stats.items()}
+
+
+def _count(model_key: str, key: str):
+    with _stats_lock:
+        _stats.setdefault(model_key or "unknown", Counter())[key] += 1
+
+
+def _candidates(content: str, toolset: ToolSet) -> Iterable[dict]:
+    """
+    Chamadas de um trecho isolado: a mensagem inteira ou o corpo de um bloco
+    ```/<tag>. Um trecho vale so se for inteiro composto de chamadas (tags
+    <function=...>, JSON ou name(...)); uma chamada citada no meio de uma frase
+    ("Posso seguir com {...}? Confirme.") nao e executada.
+    """
+    for region in _regions(content):
+        calls = _function_tags(region)
+        if calls is None:
+            calls = _json_calls(region)
+        if calls is None:
+            calls = _name_calls(region, toolset)
+        if calls:
+            yield from calls
+            return
+
+
+def _regions(content: str) -> List[str]:
+    regions = list(_FENCE_RE.findall(content))
+    regions += [body for _, body in _TAG_RE.findall(content)]
+    regions.append(content)
+    return [region.strip() for region in regions if region.strip()]
+
+
+def _only(pattern: re.Pattern, text: str) -> Optional[List[re.Match]]:
+    """Matches de pattern se o texto for so uma sequencia deles (com separadores); senao None."""
+    matches = []
+    position = 0
+    for match in pattern.finditer(text):
+        if not _CALL_SEPARATOR_RE.fullmatch(text, position, match.start()):
+            return None
+        matches.append(match)
+        position = match.end()
+    if not matches or not _CALL_SEPARATOR_RE.fullmatch(text, position):
+        return None
+    return matches
+
+
+def _function_tags(region: str) -> Optional[List[dict]]:
+    matches = _only(_FUNCTION_TAG_RE, region)
+    if matches is None:
+        return None
+    # JSON invalido vira argumento None: a chamada e rejeitada no schema
+    return [{"name": match.group(1), "args": _loads(match.group(2))} for match in matches]
+
+
+def _json_calls(region: str) -> Optional[List[dict]]:
+    values = _json_values(region)
+    if not values:
+        return None
+    return [call for value in values for call in _calls_from_json(value)]
+
+
+def _name_calls(region: str, toolset: ToolSet) -> Optional[List[dict]]:
+    matches = _only(_CALL_RE, region)
+    # Codigo qualquer (print(x)) nao conta como tentativa: precisa citar uma tool vinculada
+    if matches is None or not any(match.group(1) in toolset.by_name for match in matches):
+        return None
+    calls = []
+    for match in matches:
+        name, arguments = match.group(1), match.group(2).strip()
+        if not arguments:
+            args = {}
+        elif arguments.startswith("{"):
+            args = _loads(arguments)
+        else:
+            args = _parse_kwargs(arguments)
+        calls.append({"name": name, "args": args})
+    return calls
+
+
+def _json_values(text: str) -> List[Any]:
+    """Valores JSON que formam o texto inteiro (separados por espacos, virgulas ou ;), ou []."""
+    decoder = json.JSONDecoder()
+    values = []
+    index = 0
+    while not _CALL_SEPARATOR_RE.fullmatch(text, index):
+        start = _CALL_SEPARATOR_RE.match(text, index).end()
+        if text[start] not in "{[":
+            return []
+        try:
+            value, index = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            return []
+        values.append(value)
+    return values
+
+
+def _calls_from_json(value: Any) -> Iterable[dict]:
+    if isinstance(value, list):
+        for item in value:
+            yield from _calls_from_json(item)
+        return
+    if not isinstance(value, dict):
+        return
+    if isinstance(value.get("tool_calls"), list):
+        yield from _calls_from_json(value["tool_calls"])
+        return
+    if isinstance(value.get("function"), dict):
+        value = value["function"]
+    name = value.get("name") or value.get("tool") or value.get("tool_name")
+    if not isinstance(name, str):
+        return
+    args = next((value[key] for key in ("arguments", "args", "parameters", "input") if key in value), {})
+    if isinstance(args, str):
+        args = _loads(args)
+    if isinstance(args, dict):
+        yield {"name": name, "args": args}
+
+
+def _parse_kwargs(text: str) -> Optional[Dict[str, Any]]:
+    args = {}
+    position = 0
+    for match in _KWARG_RE.finditer(text):
+        if match.start() != position:
+            return None
+        key, raw = match.group(1), match.group(2).strip()
+        if raw[:1] in ("'", '"'):
+            args[key] = raw[1:-1]
+        else:
+            value = _loads(raw.replace("True", "true").replace("False", "false").replace("None", "null"))
+            args[key] = raw if value is None and raw != "None" else value
+        position = match.end()
+    return args if position == len(text) else None
+
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def _matches_schema(call: dict, toolset: ToolSet) -> bool:
+    """Nome conhecido e argumentos com nomes e tipos do schema da tool (sem chamar a tool)."""
+    tool = toolset.by_name.get(call["name"])
+    if tool is None:
+        return False
+    if not isinstance(call["args"], dict):
+        return False
+    parameters = tool.langchain_tool_schema["function"].get("parameters", {})
+    properties = parameters.get("properties") or {}
+    for key, value in call["args"].items():
+        if key not in properties or not _matches_type(value, properties[key]):
+            return False
+    # Schemas de Tool nao publicam "required": os obrigatorios vem do ValidationPlan
+    plan = getattr(tool, "validation_plan", None)
+    required = plan.required if plan is not None else parameters.get("required", [])
+    return all(key in call["args"] for key in required)
+
+
+def _matches_type(value: Any, schema: dict) -> bool:
+    if "anyOf" in schema:
+        return any(_matches_type(value, option) for option in schema["anyOf"])
+    expected = schema.get("type")
+    if expected is None:
+        return True
+    if expected == "null":
+        return value is None
+    if expected in ("number", "integer"):
+        if isinstance(value, str):
+            # Validacao do pydantic aceita numeros em texto ("30")
+            try:
+                value = float(value)
+            except ValueError:
+                return False
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return expected == "number" or float(value).is_integer()
+    return isinstance(value, _JSON_TYPES.get(expected, object))
@@ -1,15 +1,51 @@
-from typing import List, Dict, Any
+import asyncio
+import os
+from typing import List, Dict, Any, Optional, Tuple
 import colorama
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
-from app.infrastructure.llm import LLM, models
+from app.infrastructure.llm import Priority, llm_priority, models, resolve_model
+from app.infrastructure.llm_cache import ainvoke_cached, invoke_cached
+from app.infrastructure.model_router import model_router
+from app.infrastructure.answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from app.domain.agents.agent import Agent, SYSTEM_MESSAGE as AGENT_SYSTEM_MESSAGE, compose_user_input
 from app.domain.agents.task import TaskAgent
+from app.domain.agents.toolset import ToolSet
+from app.domain.agents.recovery import TOOL_CALL_RECOVERY_ENABLED, recover_tool_calls
+from app.domain.agents.prerouter import (
+    PRE_ROUTER_ENABLED, ROUTING_LOG_PATH, TfidfPreRouter, log_routing_decision,
+)
+from app.domain.conversation_memory import ConversationMemory, conversation_memory as default_conversation_memory
 
 NOTES = """Important Notes:
 Always confirm the completion of the requested operation with the user.
 Maintain user privacy and data security throughout the interaction.
 If a request is ambiguous or lacks specific details, ask follow-up questions to clarify the user's needs."""
 
+# Modo achatado: um unico Agent com as tools de todos os TaskAgents, sem a chamada de roteamento
+ROUTING_FLATTEN = os.getenv("ROUTING_FLATTEN", "false").lower() == "true"
+
+FLAT_CAPABILITIES = """## Capabilities
+You can handle every request below directly with the available tools:
+{capabilities}
+"""
+
+
+def merge_contexts(contexts: List[Tuple[str, str]]) -> str:
+    """
+    Junta os contextos (nome do agente, contexto) removendo linhas repetidas (data,
+    tabelas). Linhas especificas de um agente (ex.: Remarks) ficam sob o nome dele.
+    """
+    seen = set()
+    blocks = []
+    for name, context in contexts:
+        lines = [line for line in (context or "").splitlines() if line.strip() and line not in seen]
+        seen.update(lines)
+        if not lines:
+            continue
+        blocks.append("\n".join(lines if not blocks else [f"{name}:", *lines]))
+    return "\n\n".join(blocks)
+
 class RoutingAgent:
 
     def __init__(
@@ -21,18 +57,45 @@ class RoutingAgent:
             verbose: bool = True,
             prompt_extra: Dict[str, Any] = None,
             examples: List[dict] = None,
-            context: str = None
+            context: str = None,
+            pre_router: Optional[TfidfPreRouter] = None,
+            use_pre_router: bool = PRE_ROUTER_ENABLED,
+            flatten: bool = ROUTING_FLATTEN,
+            databases: Optional[List[str]] = None,
+            model: str = "routing",
+            conversation_memory: Optional[ConversationMemory] = default_conversation_memory,
     ):
         self.tools = tools or []
+        self.toolset = ToolSet(self.tools)
         self.llm = llm
+        # Escolher o TaskAgent e uma decisao simples: por padrao usa o tier de roteamento
+        self.model = resolve_model(model)
         self.system_message = system_message
         self.memory = []
-        self.step_history = []
         self.max_steps = max_steps
         self.verbose = verbose
         self.prompt_extra = prompt_extra or {}
         self.examples = self.load_examples(examples)
+        # Exemplos de roteamento convertidos uma unica vez
+        self.langchain_examples = [
+            HumanMessage(content=ex["content"]) if ex["role"] == "user" else AIMessage(content=ex["content"])
+            for ex in self.examples
+        ]
         self.context = context or ""
+        # Classificador local que evita a chamada de roteamento ao LLM em intencoes obvias
+        self.pre_router = None
+        if use_pre_router:
+            self.pre_router = pre_router or TfidfPreRouter.from_task_agents(self.tools)
+            if pre_router is None and ROUTING_LOG_PATH:
+                self.pre_router.load_decisions(ROUTING_LOG_PATH)
+        self.flatten = flatten
+        # (toolset, system_message, exemplos, configuracoes) do modo achatado; validados ja na criacao
+        self._flat: Optional[Tuple[ToolSet, str, list, Dict[str, Any]]] = self._flatten() if flatten else None
+        # Bancos (registrados em answer_cache) lidos pelos TaskAgents; None = todos
+        self.databases = databases
+        self.answer_cache_key = "|".join(self.toolset.names)
+        # Conversa anterior de cada usuario (por employee_id), incluida no roteamento e na execucao
+        self.conversation_memory = conversation_memory
 
     def load_examples(self, examples: List[dict] = None):
         examples = examples or []
@@ -41,7 +104,205 @@ class RoutingAgent:
         return examples
 
     def run(self, user_input: str, employee_id: int = None, **kwargs):
-        context = kwargs.get("context") or self.context
+        routed = self._pre_route(user_input)
+        history = None if routed else self._history(employee_id)
+        cacheable = self._answer_cacheable(employee_id, kwargs)
+        if cacheable:
+            cache_agent = self._answer_cache_agent(history)
+            answer = answer_cache.get(employee_id, user_input, cache_agent, self.databases)
+            if answer is not None:
+                self.to_console("CACHED ANSWER", answer)
+                self._remember(employee_id, user_input, answer)
+                return answer
+            versions = answer_cache.versions(self.databases)
+
+        answer, completed = self._run(user_input, routed=routed, history=history, **kwargs)
+        # Execucao interrompida (loop, deadline): a resposta parcial nao deve ser reaproveitada
+        if not completed:
+            return answer
+        if cacheable:
+            answer_cache.set(employee_id, user_input, cache_agent, answer, versions, self.databases)
+        self._remember(employee_id, user_input, answer)
+        return answer
+
+    async def arun(self, user_input: str, employee_id: int = None, **kwargs):
+        """Versao assincrona de run (ainvoke no roteamento e Agent.arun na execucao)."""
+        routed = self._pre_route(user_input)
+        # A memoria de conversa pode ser SQLite: fora do event loop
+        history = None if routed else await asyncio.to_thread(self._history, employee_id)
+        cacheable = self._answer_cacheable(employee_id, kwargs)
+        if cacheable:
+            cache_agent = self._answer_cache_agent(history)
+            answer = answer_cache.get(employee_id, user_input, cache_agent, self.databases)
+            if answer is not None:
+                self.to_console("CACHED ANSWER", answer)
+                await asyncio.to_thread(self._remember, employee_id, user_input, answer)
+                return answer
+            versions = answer_cache.versions(self.databases)
+
+        answer, completed = await self._arun(user_input, routed=routed, history=history, **kwargs)
+        if not completed:
+            return answer
+        if cacheable:
+            answer_cache.set(employee_id, user_input, cache_agent, answer, versions, self.databases)
+        await asyncio.to_thread(self._remember, employee_id, user_input, answer)
+        return answer
+
+    def _history(self, employee_id: Optional[int]) -> Optional[str]:
+        if self.conversation_memory is None or employee_id is None:
+            return None
+        return self.conversation_memory.context(employee_id)
+
+    def _remember(self, employee_id: Optional[int], user_input: str, answer):
+        if self.conversation_memory is not None and employee_id is not None and isinstance(answer, str):
+            self.conversation_memory.record(employee_id, user_input, answer)
+
+    def _answer_cache_agent(self, history: Optional[str]) -> str:
+        # Perguntas de acompanhamento ("e a anterior?") dependem da conversa: ela entra na chave
+        return f"{self.answer_cache_key}|{history}" if history else self.answer_cache_key
+
+    @staticmethod
+    def _answer_cacheable(employee_id: Optional[int], kwargs: Dict[str, Any]) -> bool:
+        # Contexto extra muda a resposta; sem usuario nao ha como separar as entradas
+        return ANSWER_CACHE_ENABLED and employee_id is not None and not kwargs.get("context")
+
+    def _run(self, user_input: str, routed: str = None, history: str = None, **kwargs) -> Tuple[str, bool]:
+        """Retorna (resposta, completou): completou e False quando o Agent desistiu no meio."""
+        if routed is not None:
+            return self._execute(self.prepare_agent(routed, {}), user_input)
+        if self.flatten:
+            return self._execute(self.flattened_agent(), user_input, history)
+
+        messages = self._routing_messages(user_input, kwargs.get("context") or self.context, history)
+
+        # Modelo com os TaskAgents vinculados como tools (com failover entre provedores)
+        model_with_tools = model_router.bind(self.toolset, self.llm, self.model)
+        # A escolha do agente e curta e bloqueia todo o resto: passa na frente na fila do provedor
+        with llm_priority(Priority.ROUTING):
+            response = invoke_cached(model_with_tools, messages, self.llm, self.model, self.toolset.schemas)
+
+        agent = self._agent_from_response(response, user_input)
+        if agent is None:
+            return response.content, True
+        return self._execute(agent, user_input, history)
+
+    async def _arun(self, user_input: str, routed: str = None, history: str = None, **kwargs) -> Tuple[str, bool]:
+        if routed is not None:
+            return await self._aexecute(self.prepare_agent(routed, {}), user_input)
+        if self.flatten:
+            return await self._aexecute(self.flattened_agent(), user_input, history)
+
+        messages = self._routing_messages(user_input, kwargs.get("context") or self.context, history)
+
+        model_with_tools = model_router.bind(self.toolset, self.llm, self.model)
+        with llm_priority(Priority.ROUTING):
+            response = await ainvoke_cached(model_with_tools, messages, self.llm, self.model, self.toolset.schemas)
+
+        agent = self._agent_from_response(response, user_input)
+        if agent is None:
+            return response.content, True
+        return await self._aexecute(agent, user_input, history)
+
+    @staticmethod
+    def _execute(agent: Agent, user_input: str, history: str = None) -> Tuple[str, bool]:
+        run_context = agent.start_run(user_input, history=history)
+        answer = agent.run_steps(run_context)
+        return answer, not run_context.gave_up
+
+    @staticmethod
+    async def _aexecute(agent: Agent, user_input: str, history: str = None) -> Tuple[str, bool]:
+        run_context = agent.start_run(user_input, history=history)
+        answer = await agent.arun_steps(run_context)
+        return answer, not run_context.gave_up
+
+    def _pre_route(self, user_input: str) -> Optional[str]:
+        """
+        Nome do TaskAgent escolhido localmente, ou None para seguir com o roteador LLM.
+
+        Uma intencao reconhecida com confianca e uma mensagem autossuficiente: roda
+        sem a conversa anterior, entao o prompt (e a chave dos caches de resposta e
+        do LLM) nao muda a cada turno.
+        """
+        if self.pre_router is None:
+            return None
+        prediction = self.pre_router.route(user_input)
+        if prediction is None:
+            return None
+        task_agent = self.toolset.by_name.get(prediction.label)
+        # Agentes com argumentos obrigatorios dependem do LLM para extrai-los
+        if task_agent is None or task_agent.requires_args:
+            return None
+
+        self.to_console("PRE-ROUTED", f"{prediction.label} (score={prediction.score:.2f}, margin={prediction.margin:.2f})")
+        return prediction.label
+
+    def flattened_agent(self) -> Agent:
+        """Agent unico com as tools de todos os TaskAgents: resolve em uma chamada a menos."""
+        if self._flat is None:
+            self._flat = self._flatten()
+        toolset, system_message, examples, settings = self._flat
+        agents = self._flat_agents()
+
+        # Contextos e tools dinamicos (ex.: data de hoje) sao gerados a cada execucao, como em load_agent
+        context = merge_contexts([(agent.name, agent.create_context()) for agent in agents if agent.create_context])
+        user_context = merge_contexts([
+            (agent.name, agent.create_user_context()) for agent in agents if agent.create_user_context
+        ])
+        loaded = [tool for agent in agents if agent.tool_loader for tool in agent.tool_loader()]
+        if loaded:
+            toolset = ToolSet([*toolset, *(tool for tool in loaded if tool.name not in toolset.by_name)])
+        return Agent(
+            tools=toolset,
+            system_message=system_message,
+            llm=self.llm,
+            verbose=self.verbose,
+            context=context or None,
+            user_context=user_context or None,
+            langchain_examples=examples,
+            **settings,
+        )
+
+    def _flat_agents(self) -> List[TaskAgent]:
+        # Sem roteador nao ha quem preencha argumentos obrigatorios (ex.: ids extraidos da mensagem)
+        return [agent for agent in self.tools if not agent.requires_args]
+
+    def _flatten(self) -> Tuple[ToolSet, str, list, Dict[str, Any]]:
+        agents = self._flat_agents()
+        skipped = [agent.name for agent in self.tools if agent.requires_args]
+        if skipped:
+            print(f"Flattened routing skips agents with required arguments: {', '.join(skipped)}")
+        if not agents:
+            raise ValueError("Flattened routing needs at least one TaskAgent without required arguments")
+
+        # Um unico Agent executa tudo: os TaskAgents precisam concordar nas configuracoes de execucao
+        settings = {}
+        for field in ("model", "escalation_model", "finish_policy"):
+            values = {getattr(agent, field) for agent in agents}
+            if len(values) > 1:
+                raise ValueError(f"Cannot flatten TaskAgents with different {field} values: {sorted(map(str, values))}")
+            settings[field] = values.pop()
+
+        tools = {}
+        for agent in agents:
+            for tool in agent.compiled_toolset():
+                if tools.setdefault(tool.name, tool) is not tool:
+                    raise ValueError(f"Tool {tool.name} is defined by more than one TaskAgent")
+
+        # Fragmentos de prompt de cada TaskAgent (sem repeticao) com um unico {context} no final
+        fragments = []
+        for agent in agents:
+            fragment = (agent.system_message or AGENT_SYSTEM_MESSAGE).replace("{context}", "").strip()
+            if fragment not in fragments:
+                fragments.append(fragment)
+        capabilities = "\n".join(f"- {agent.name}: {agent.description}" for agent in agents)
+        system_message = "\n\n".join([
+            *fragments, FLAT_CAPABILITIES.format(capabilities=capabilities), "{context}"
+        ])
+
+        examples = [message for agent in agents for message in agent.langchain_examples()]
+        return ToolSet(list(tools.values())), system_message, examples, settings
+
+    def _routing_messages(self, user_input: str, context: str, history: str = None):
         if context:
             user_input_with_context = f"{context}\n---\n\nUser Message: {user_input}"
         else:
@@ -53,47 +314,47 @@ class RoutingAgent:
         system_message = self.system_message.format(**partial_variables)
 
         # Converter mensagens para formato LangChain
-        messages = [
+        return [
             SystemMessage(content=system_message),
-            *[HumanMessage(content=ex["content"]) if ex["role"] == "user" else AIMessage(content=ex["content"]) for ex in self.examples],
-            HumanMessage(content=user_input)
+            *self.langchain_examples,
+            HumanMessage(content=compose_user_input(user_input, history=history))
         ]
 
-        # Converter tools para formato LangChain
-        tools = [tool.langchain_tool_schema for tool in self.tools]
-
-        # Bind tools e invocar
-        model = self.llm[LLM]
-        model_with_tools = model.bind_tools(tools)
-        response = model_with_tools.invoke(messages)
-        
-        self.step_history.append(response)
+    def _agent_from_response(self, response: AIMessage, user_input: str = None):
+        """Retorna o Agent escolhido pelo roteador, ou None se o modelo respondeu sem tool call."""
         self.to_console("RESPONSE", response.content, color="blue")
-        
+
+        tool_calls = response.tool_calls
+        if not tool_calls and TOOL_CALL_RECOVERY_ENABLED:
+            # Agente escolhido mas escrito como texto (ex.: {"name": "query_agent", ...})
+            tool_calls = recover_tool_calls(response.content, self.toolset, self.model)
+
         # Verificar se há tool calls
-        if not response.tool_calls:
+        if not tool_calls:
             self.to_console("Tool Name", "None")
             self.to_console("Tool Args", "None")
-            return response.content
+            return None
             
         # Extrair informações da tool call
-        tool_call = response.tool_calls[0]
+        tool_call = tool_calls[0]
         tool_name = tool_call["name"]
         tool_args = tool_call["args"]
         
         self.to_console("Tool Name", tool_name)
         self.to_console("Tool Args", str(tool_args))
 
-        # Preparar e executar o agente
-        agent = self.prepare_agent(tool_name, tool_args)
-        return agent.run(user_input)
+        if user_input is not None:
+            log_routing_decision(user_input, tool_name)
+
+        # Preparar o agente
+        return self.prepare_agent(tool_name, tool_args)
 
     def prepare_agent(self, tool_name: str, tool_kwargs: Dict[str, Any]):
-        for agent in self.tools:
-            if agent.name == tool_name:
-                input_kwargs = agent.arg_model.model_validate(tool_kwargs)
-                return agent.load_agent(**input_kwargs.model_dump())
-        raise ValueError(f"Agent {tool_name} not found")
+        agent = self.toolset.by_name.get(tool_name)
+        if agent is None:
+            raise ValueError(f"Agent {tool_name} not found")
+        input_kwargs = agent.arg_model.model_validate(tool_kwargs)
+        return agent.load_agent(**input_kwargs.model_dump())
 
     def to_console(self, tag: str, message: str, color: str = "green"):
         if self.verbose:
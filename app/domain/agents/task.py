@@ -1,15 +1,23 @@
+from functools import lru_cache
 from typing import Type, Callable, Optional, List
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 
-from app.domain.agents.agent import Agent
+from app.domain.agents.agent import AGENT_FINISH_POLICY, Agent, FinishPolicy, convert_to_langchain_messages
+from app.domain.agents.toolset import ToolSet
 from app.domain.tools.report_tool import report_tool
 from app.domain.tools.utils.system_message_factory import StaticSystemMessageProvider, SystemMessageProvider
-from app.domain.tools.utils.utils import convert_to_langchain_tool
+from app.domain.tools.utils.utils import convert_to_langchain_tool, convert_to_openai_tool
 
 from langchain_core.tools import BaseTool
 
 DEFAULT_SYSTEM_MESSAGE = """"""
 
+@lru_cache(maxsize=None)
+def _build_agent_tool_schema(arg_model: Type[BaseModel], name: str, description: str, langchain: bool) -> dict:
+    """Schema do TaskAgent como tool, calculado uma unica vez. Nao modificar o retorno."""
+    convert = convert_to_langchain_tool if langchain else convert_to_openai_tool
+    return convert(arg_model, name=name, description=description)
+
 class EmptyArgModel(BaseModel):
     pass
 
@@ -34,9 +42,21 @@ class TaskAgent(BaseModel):
     tools: List[BaseTool]  # Mudança: agora aceita BaseTool do LangChain
     examples: Optional[List[dict]] = None
     routing_example: List[dict] = Field(default_factory=list)
+    # Palavras-chave usadas pelo pre-roteador local (ver prerouter.py)
+    keywords: List[str] = Field(default_factory=list)
+    finish_policy: FinishPolicy = AGENT_FINISH_POLICY
+    # Tier ("execution", "escalation", ...) ou chave de MODEL_CONFIGS usada na execucao
+    model: str = "execution"
+    # Modelo assumido apos uma tool call com falha ou argumentos invalidos (None desliga)
+    escalation_model: Optional[str] = "escalation"
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    # Tools compiladas (schemas, mapa por nome, bind) reaproveitadas entre execucoes
+    _toolset: Optional[ToolSet] = PrivateAttr(default=None)
+    # Exemplos few-shot ja convertidos para mensagens LangChain
+    _langchain_examples: Optional[list] = PrivateAttr(default=None)
+
     def __init__(self, **data):
         # Compatibilidade: se system_message foi passado, usar StaticProvider
         if 'system_message' in data and data['system_message'] is not None:
@@ -52,28 +72,49 @@ class TaskAgent(BaseModel):
         context = self.create_context(**kwargs) if self.create_context else None
         user_context = self.create_user_context(**kwargs) if self.create_user_context else None
 
+        # Tools dinamicas geram um ToolSet proprio da execucao; a definicao nao e alterada
         if self.tool_loader:
-            self.tools.extend(self.tool_loader(**kwargs))
-
-        if report_tool not in self.tools:
-            self.tools.append(report_tool)
+            toolset = ToolSet(self._with_report_tool([*self.tools, *self.tool_loader(**kwargs)]))
+        else:
+            toolset = self.compiled_toolset()
 
         return Agent(
-            tools=self.tools,
+            tools=toolset,
             context=context,
             user_context=user_context,
             system_message=self.system_message,
             examples=self.examples,
+            langchain_examples=self.langchain_examples(),
+            finish_policy=self.finish_policy,
+            model=self.model,
+            escalation_model=self.escalation_model,
         )
 
+    def langchain_examples(self) -> list:
+        if self._langchain_examples is None:
+            self._langchain_examples = convert_to_langchain_messages(self.examples or [])
+        return self._langchain_examples
+
+    def compiled_toolset(self) -> ToolSet:
+        if self._toolset is None:
+            self._toolset = ToolSet(self._with_report_tool(self.tools))
+        return self._toolset
+
+    @property
+    def requires_args(self) -> bool:
+        """True se o arg_model tem campos obrigatorios (so o roteador LLM sabe preenche-los)."""
+        return any(field.is_required() for field in self.arg_model.model_fields.values())
+
+    @staticmethod
+    def _with_report_tool(tools: list) -> list:
+        return tools if report_tool in tools else [*tools, report_tool]
+
     @property
     def langchain_tool_schema(self):
         """Retorna o schema da tool no formato LangChain."""
-        return convert_to_langchain_tool(self.arg_model, name=self.name, description=self.description)
+        return _build_agent_tool_schema(self.arg_model, self.name, self.description, langchain=True)
 
     @property
     def openai_tool_schema(self):
         """Mantido para compatibilidade - retorna o schema da tool no formato OpenAI."""
-        # Import local para evitar dependência circular
-        from app.domain.tools.utils.utils import convert_to_openai_tool
-        return convert_to_openai_tool(self.arg_model, name=self.name, description=self.description)
+        return _build_agent_tool_schema(self.arg_model, self.name, self.description, langchain=False)
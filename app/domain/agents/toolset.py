@@ -0,0 +1,52 @@
+import threading
+from typing import Any, Dict, List, Mapping, Tuple
+
+# (model_key, nomes das tools) -> (modelo, runnable com as tools ja vinculadas)
+_BOUND_MODELS: Dict[Tuple[str, Tuple[str, ...]], Tuple[Any, Any]] = {}
+_BOUND_MODELS_LOCK = threading.Lock()
+
+
+class ToolSet:
+    """
+    Conjunto de tools de um agente compilado uma unica vez: schemas LangChain,
+    mapa nome -> tool e o modelo com as tools vinculadas (bind_tools) em cache.
+
+    Aceita tanto Tools quanto TaskAgents (ambos expoem name e langchain_tool_schema).
+    """
+
+    def __init__(self, tools: List[Any]):
+        self.tools = list(tools)
+        self.by_name: Dict[str, Any] = {tool.name: tool for tool in self.tools}
+        self.schemas = [tool.langchain_tool_schema for tool in self.tools]
+        self.names: Tuple[str, ...] = tuple(tool.name for tool in self.tools)
+
+    def __iter__(self):
+        return iter(self.tools)
+
+    def __len__(self):
+        return len(self.tools)
+
+    def __contains__(self, tool: Any) -> bool:
+        return self.by_name.get(getattr(tool, "name", None)) is tool
+
+    def get(self, name: str):
+        tool = self.by_name.get(name)
+        if tool is None:
+            raise ValueError(f"Tool {name} not found in tools list.")
+        return tool
+
+    def bind(self, llm: Mapping[str, Any], model_key: str):
+        """Retorna llm[model_key].bind_tools(schemas), reaproveitando o runnable entre execucoes."""
+        model = llm[model_key]
+        cache_key = (model_key, self.names)
+        cached = _BOUND_MODELS.get(cache_key)
+        # Compara a instancia para respeitar models.configure(), que recria o modelo
+        if cached is not None and cached[0] is model:
+            return cached[1]
+
+        with _BOUND_MODELS_LOCK:
+            cached = _BOUND_MODELS.get(cache_key)
+            if cached is None or cached[0] is not model:
+                cached = (model, model.bind_tools(self.schemas))
+                _BOUND_MODELS[cache_key] = cached
+        return cached[1]
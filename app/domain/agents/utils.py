@@ -1,3 +1,4 @@
+from collections.abc import Mapping
 from datetime import datetime
 from typing import Type
 import types
@@ -13,17 +14,38 @@ def parse_function_args(response):
     return response.tool_calls[0]["args"]
 
 def get_tool_from_response(response, tools):
-    """Get tool from LangChain AIMessage response"""
+    """Get tool from LangChain AIMessage response (tools: list or name -> tool mapping)"""
     tool_name = response.tool_calls[0]["name"]
+    if isinstance(tools, Mapping):
+        if tool_name in tools:
+            return tools[tool_name]
+        raise ValueError(f"Tool {tool_name} not found in tools list.")
     for t in tools:
         if t.name == tool_name:
             return t
     raise ValueError(f"Tool {tool_name} not found in tools list.")
 
 def run_tool_from_response(response, tools):
-    tool = get_tool_from_response(response, tools)
-    tool_kwargs = parse_function_args(response)
-    return tool._run(**tool_kwargs)
+    return run_tool_call(response.tool_calls[0], tools)
+
+def _find_tool(tool_name: str, tools):
+    if isinstance(tools, Mapping):
+        tool = tools.get(tool_name)
+    else:
+        tool = next((t for t in tools if t.name == tool_name), None)
+    if tool is None:
+        raise ValueError(f"Tool {tool_name} not found in tools list.")
+    return tool
+
+def run_tool_call(tool_call: dict, tools):
+    """Executa um tool call ({"name", "args", ...}) contra uma lista ou mapa nome -> tool"""
+    tool = _find_tool(tool_call["name"], tools)
+    return tool._run(**(tool_call.get("args") or {}))
+
+async def arun_tool_call(tool_call: dict, tools):
+    """Versao assincrona de run_tool_call (usa o _arun da tool)"""
+    tool = _find_tool(tool_call["name"], tools)
+    return await tool._arun(**(tool_call.get("args") or {}))
 
 def orm_model_to_string(input_model_cls: Type[BaseModel]):
     """Get the ORM model string from the input model"""
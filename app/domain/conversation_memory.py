@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel
+
+from app.infrastructure.llm import Priority, llm_priority, models, resolve_model
+from app.infrastructure.model_router import model_router
+from app.infrastructure.tokens import get_tokenizer
+
+CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() == "true"
+CONVERSATION_MEMORY_BACKEND = os.getenv("CONVERSATION_MEMORY_BACKEND", "sqlite")
+CONVERSATION_DB_PATH = os.getenv(
+    "CONVERSATION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "conversations.db"),
+)
+# Turnos recentes mantidos na integra; os mais antigos entram no resumo
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))
+# Teto do contexto de conversa (resumo + turnos) incluido em cada mensagem
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "800"))
+# Depois desse tempo sem mensagens a conversa recomeca do zero
+CONVERSATION_IDLE_SECONDS = float(os.getenv("CONVERSATION_IDLE_SECONDS", "21600"))
+# Modelo (tier ou chave de MODEL_CONFIGS) que reescreve o resumo; vazio = resumo local, sem LLM
+CONVERSATION_SUMMARY_MODEL = os.getenv("CONVERSATION_SUMMARY_MODEL", "")
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a database assistant.
+Keep facts the user may refer to later (names, amounts, dates, ids, what was listed or added).
+Answer with the new summary only, at most {max_words} words."""
+
+# Tamanho de cada turno no resumo local
+_SUMMARY_LINE_CHARS = 200
+
+
+class ConversationTurn(BaseModel):
+    id: int
+    user_message: str
+    answer: str
+    created_at: float
+
+
+# 1. Interface do armazenamento de conversas
+class ConversationStore(ABC):
+    @abstractmethod
+    def add_turn(self, user_id: int, user_message: str, answer: str) -> None:
+        pass
+
+    @abstractmethod
+    def turns(self, user_id: int) -> List[ConversationTurn]:
+        """Turnos ainda nao resumidos, do mais antigo para o mais recente."""
+        pass
+
+    @abstractmethod
+    def summary(self, user_id: int) -> str:
+        pass
+
+    @abstractmethod
+    def fold(self, user_id: int, summary: str, upto_id: int) -> None:
+        """Grava o novo resumo e remove os turnos ate upto_id (inclusive), que ele passa a cobrir."""
+        pass
+
+    @abstractmethod
+    def clear(self, user_id: int) -> None:
+        pass
+
+
+# 2. Implementações concretas
+class InMemoryConversationStore(ConversationStore):
+    """Conversas por processo; somem no restart."""
+
+    def __init__(self):
+        self._turns: Dict[int, List[ConversationTurn]] = {}
+        self._summaries: Dict[int, str] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add_turn(self, user_id: int, user_message: str, answer: str) -> None:
+        with self._lock:
+            turn = ConversationTurn(id=self._next_id, user_message=user_message, answer=answer, created_at=time.time())
+            self._next_id += 1
+            self._turns.setdefault(user_id, []).append(turn)
+
+    def turns(self, user_id: int) -> List[ConversationTurn]:
+        with self._lock:
+            return list(self._turns.get(user_id, []))
+
+    def summary(self, user_id: int) -> str:
+        return self._summaries.get(user_id, "")
+
+    def fold(self, user_id: int, summary: str, upto_id: int) -> None:
+        with self._lock:
+            self._summaries[user_id] = summary
+            self._turns[user_id] = [turn for turn in self._turns.get(user_id, []) if turn.id > upto_id]
+
+    def clear(self, user_id: int) -> None:
+        with self._lock:
+            self._turns.pop(user_id, None)
+            self._summaries.pop(user_id, None)
+
+
+class SqliteConversationStore(ConversationStore):
+    """Conversas em SQLite, indexadas por User.id; sobrevivem a restarts e sao compartilhadas entre workers."""
+
+    def __init__(self, db_path: Union[str, Path] = CONVERSATION_DB_PATH):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_turn ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+            "user_message TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS conversation_turn_user ON conversation_turn (user_id, id)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_summary (user_id INTEGER PRIMARY KEY, summary TEXT NOT NULL)"
+        )
+
+    def add_turn(self, user_id: int, user_message: str, answer: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO conversation_turn (user_id, user_message, answer, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, user_message, answer, time.time()),
+            )
+
+    def turns(self, user_id: int) -> List[ConversationTurn]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, user_message, answer, created_at FROM conversation_turn WHERE user_id = ? ORDER BY id",
+                (user_id,),
+            ).fetchall()
+        return [ConversationTurn(id=row[0], user_message=row[1], answer=row[2], created_at=row[3]) for row in rows]
+
+    def summary(self, user_id: int) -> str:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT summary FROM conversation_summary WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0] if row else ""
+
+    def fold(self, user_id: int, summary: str, upto_id: int) -> None:
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO conversation_summary (user_id, summary) VALUES (?, ?)", (user_id, summary)
+            )
+            self._connection.execute(
+                "DELETE FROM conversation_turn WHERE user_id = ? AND id <= ?", (user_id, upto_id)
+            )
+            self._connection.execute("COMMIT")
+
+    def clear(self, user_id: int) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM conversation_turn WHERE user_id = ?", (user_id,))
+            self._connection.execute("DELETE FROM conversation_summary WHERE user_id = ?", (user_id,))
+
+
+# 3. Factory
+def create_conversation_store(backend: str = CONVERSATION_MEMORY_BACKEND) -> ConversationStore:
+    if backend == "memory":
+        return InMemoryConversationStore()
+    if backend == "sqlite":
+        return SqliteConversationStore()
+    raise ValueError(f"Backend de memoria de conversa nao suportado: {backend}. Use 'memory' ou 'sqlite'.")
+
+
+class ConversationMemory:
+    """
+    Memoria de conversa por usuario: ultimos max_turns turnos na integra e um
+    resumo dos anteriores, renderizados em no maximo max_tokens tokens.
+
+    O resumo e atualizado fora do caminho da resposta (thread propria, prioridade
+    BACKGROUND na fila do provedor quando usa o LLM).
+    """
+
+    def __init__(
+            self,
+            store: ConversationStore,
+            max_turns: int = CONVERSATION_MAX_TURNS,
+            max_tokens: int = CONVERSATION_MAX_TOKENS,
+            idle_seconds: float = CONVERSATION_IDLE_SECONDS,
+            summary_model: Optional[str] = CONVERSATION_SUMMARY_MODEL,
+    ):
+        self.store = store
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.idle_seconds = idle_seconds
+        self.summary_model = resolve_model(summary_model)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation")
+        self._folding = set()
+        self._folding_lock = threading.Lock()
+
+    def context(self, user_id: int) -> Optional[str]:
+        """Conversa anterior do usuario pronta para o prompt, ou None se nao ha nada recente."""
+        turns = self.store.turns(user_id)
+        summary = self.store.summary(user_id)
+        if turns and time.time() - turns[-1].created_at > self.idle_seconds:
+            self.store.clear(user_id)
+            return None
+        if not turns and not summary:
+            return None
+        return self._render(summary, turns[-self.max_turns:])
+
+    def record(self, user_id: int, user_message: str, answer: str):
+        self.store.add_turn(user_id, user_message, answer)
+        if len(self.store.turns(user_id)) > self.max_turns:
+            self._schedule_fold(user_id)
+
+    def clear(self, user_id: int):
+        self.store.clear(user_id)
+
+    def _schedule_fold(self, user_id: int):
+        with self._folding_lock:
+            if user_id in self._folding:
+                return
+            self._folding.add(user_id)
+        self._executor.submit(self._fold, user_id)
+
+    def _fold(self, user_id: int):
+        try:
+            turns = self.store.turns(user_id)
+            overflow = turns[:-self.max_turns]
+            if not overflow:
+                return
+            summary = self.summarize(self.store.summary(user_id), overflow)
+            self.store.fold(user_id, summary, overflow[-1].id)
+        except Exception as e:
+            print(f"Failed to summarize conversation of user {user_id}: {e}")
+        finally:
+            with self._folding_lock:
+                self._folding.discard(user_id)
+
+    def summarize(self, summary: str, turns: List[ConversationTurn]) -> str:
+        if self.summary_model:
+            try:
+                return self._summarize_with_llm(summary, turns)
+            except Exception as e:
+                print(f"LLM summary failed, using local summary: {e}")
+        return self._summarize_locally(summary, turns)
+
+    def _summarize_with_llm(self, summary: str, turns: List[ConversationTurn]) -> str:
+        transcript = "\n".join(_turn_lines(turns))
+        messages = [
+            SystemMessage(content=SUMMARY_PROMPT.format(max_words=self.max_tokens // 4)),
+            HumanMessage(content=f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"),
+        ]
+        # Resumo nao tem ninguem esperando: fica atras das mensagens dos usuarios na fila do provedor
+        with llm_priority(Priority.BACKGROUND):
+            response = model_router.complete(models, self.summary_model, messages)
+        return str(response.content).strip()
+
+    def _summarize_locally(self, summary: str, turns: List[ConversationTurn]) -> str:
+        """Uma linha curta por turno; as mais antigas saem quando passa de metade do budget."""
+        lines = [line for line in summary.splitlines() if line.strip()]
+        lines.extend(
+            f"- User: {_shorten(turn.user_message)} | Assistant: {_shorten(turn.answer)}" for turn in turns
+        )
+        counter = get_tokenizer()
+        while len(lines) > 1 and counter.count("\n".join(lines)) > self.max_tokens // 2:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def _render(self, summary: str, turns: List[ConversationTurn]) -> str:
+        counter = get_tokenizer()
+        while True:
+            blocks = []
+            if summary:
+                blocks.append(f"Earlier in this conversation:\n{summary}")
+            if turns:
+                blocks.append("Recent messages:\n" + "\n".join(_turn_lines(turns)))
+            text = "\n\n".join(blocks)
+            tokens = counter.count(text)
+            if tokens <= self.max_tokens:
+                return text
+            if len(turns) > 1:
+                turns = turns[1:]
+            elif summary:
+                summary = ""
+            else:
+                return counter.truncate(text, self.max_tokens)
+
+
+def _turn_lines(turns: List[ConversationTurn]) -> List[str]:
+    return [line for turn in turns for line in (f"User: {turn.user_message}", f"Assistant: {turn.answer}")]
+
+
+def _shorten(text: str, limit: int = _SUMMARY_LINE_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+conversation_memory = ConversationMemory(create_conversation_store()) if CONVERSATION_MEMORY_ENABLED else None
@@ -35,4 +35,20 @@ class TranscriptionError(Exception):
 
     def __init__(self, detail: str, *args: object) -> None:
         super().__init__(*args)
-        self.detail = detail
\ No newline at end of file
+        self.detail = detail
+
+
+class QueueFullError(Exception):
+    max_size: int
+
+    def __init__(self, max_size: int, *args: object) -> None:
+        super().__init__(*args)
+        self.max_size = max_size
+
+
+class LLMUnavailableError(Exception):
+    errors: dict
+
+    def __init__(self, errors: dict, *args: object) -> None:
+        super().__init__(*args)
+        self.errors = errors
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.domain import message_service
+from app.domain.exceptions import QueueFullError
+from app.infrastructure.job_queue import JobQueue, job_queue
+from app.schema import User
+
+log = logging.getLogger(__name__)
+
+# Janela de silencio apos a ultima mensagem antes de rodar o agente
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "1.5"))
+# Tempo maximo que a primeira mensagem pode esperar, mesmo que o usuario continue digitando
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", "5"))
+# No shutdown, tempo maximo esperando os lotes pendentes (ja respondidos com 200 para a Meta) terminarem
+COALESCE_DRAIN_SECONDS = float(os.getenv("COALESCE_DRAIN_SECONDS", "30"))
+
+
+class _UserBuffer:
+    def __init__(self, user: User):
+        self.user = user
+        self.messages: List[str] = []
+        self.deadline: Optional[float] = None
+        self.first_at: Optional[float] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.running = False
+        self.done: Optional[asyncio.Future] = None
+
+
+class MessageCoalescer:
+    """
+    Junta as mensagens que um mesmo usuario envia em sequencia ("add expense",
+    "30 euros", "lunch") em uma unica entrada para o agente.
+
+    Cada telefone tem no maximo um job em execucao; mensagens que chegam
+    enquanto o agente roda sao acumuladas e processadas juntas em seguida.
+    """
+
+    def __init__(
+            self,
+            handler: Callable[[str, User], Any],
+            queue: JobQueue = job_queue,
+            window_seconds: float = COALESCE_WINDOW_SECONDS,
+            max_wait_seconds: float = COALESCE_MAX_WAIT_SECONDS,
+    ):
+        self.handler = handler
+        self.queue = queue
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._buffers: Dict[str, _UserBuffer] = {}
+        self._stopping = False
+
+    def add(self, user: User, messages: List[str], deadline: Optional[float] = None):
+        """Acumula mensagens do usuario. Levanta QueueFullError se nao houver como atende-las."""
+        buffer = self._buffers.get(user.phone)
+        if (buffer is None or not buffer.messages) and self._reserved_slots() >= self.queue.max_size:
+            # Sem lote pendente para pegar carona: precisaria de um novo slot na fila, e cada
+            # lote ainda nao enviado ja tem um slot reservado
+            raise QueueFullError(self.queue.max_size, "Job queue is full")
+
+        if buffer is None:
+            buffer = self._buffers[user.phone] = _UserBuffer(user)
+
+        buffer.user = user
+        buffer.messages.extend(messages)
+        if deadline is not None:
+            buffer.deadline = max(buffer.deadline or deadline, deadline)
+
+        if not buffer.running:
+            self._schedule(buffer)
+
+    async def stop(self, timeout: float = COALESCE_DRAIN_SECONDS):
+        """
+        Envia os lotes pendentes para a fila sem esperar a janela e aguarda ate
+        timeout segundos por eles: essas mensagens ja foram confirmadas para a
+        Meta (200 + seen_messages) e nao seriam reenviadas.
+        Deve rodar antes de job_queue.stop().
+        """
+        self._stopping = True
+        for phone, buffer in list(self._buffers.items()):
+            if buffer.timer:
+                buffer.timer.cancel()
+                buffer.timer = None
+            self._flush(phone)
+
+        loop = asyncio.get_running_loop()
+        drain_until = loop.time() + timeout
+        while True:
+            # _on_done envia na hora o que chegou durante a execucao, entao a lista muda a cada volta
+            running = [b.done for b in self._buffers.values() if b.running and b.done is not None]
+            remaining = drain_until - loop.time()
+            if not running or remaining <= 0:
+                break
+            await asyncio.wait(running, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
+        stats = self.stats()
+        if stats["pending_messages"] or stats["running"]:
+            log.warning(
+                "Coalescer stopped with %s pending message(s) and %s running job(s)",
+                stats["pending_messages"], stats["running"],
+            )
+        for buffer in self._buffers.values():
+            if buffer.timer:
+                buffer.timer.cancel()
+        self._buffers.clear()
+
+    def _reserved_slots(self) -> int:
+        """Jobs na fila + lotes pendentes que ainda vao precisar de um slot nela."""
+        return self.queue.depth() + sum(1 for buffer in self._buffers.values() if buffer.messages)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._buffers),
+            "pending_messages": sum(len(b.messages) for b in self._buffers.values()),
+            "running": sum(1 for b in self._buffers.values() if b.running),
+        }
+
+    def _schedule(self, buffer: _UserBuffer, delay: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if buffer.first_at is None:
+            buffer.first_at = now
+
+        if delay is None:
+            # Debounce: reinicia a janela, limitado pelo tempo maximo de espera
+            delay = min(self.window_seconds, max(0.0, buffer.first_at + self.max_wait_seconds - now))
+
+        if buffer.timer:
+            buffer.timer.cancel()
+        buffer.timer = loop.call_later(delay, self._flush, buffer.user.phone)
+
+    def _flush(self, phone: str):
+        buffer = self._buffers.get(phone)
+        if buffer is None or buffer.running or not buffer.messages:
+            return
+        buffer.timer = None
+
+        if buffer.deadline is not None and time.time() >= buffer.deadline:
+            log.warning("Dropping coalesced batch for %s: deadline expired before it was queued", phone)
+            self._drop(phone, buffer)
+            return
+
+        user_message = "\n".join(buffer.messages)
+        try:
+            job = self.queue.submit(self.handler, user_message, buffer.user, deadline=buffer.deadline)
+        except QueueFullError:
+            if self._stopping:
+                log.warning("Job queue full during shutdown, dropping coalesced batch for %s", phone)
+                return
+            log.warning("Job queue full, retrying coalesced batch for %s", phone)
+            self._schedule(buffer, delay=max(self.window_seconds, 0.1))
+            return
+
+        if len(buffer.messages) > 1:
+            log.info("Coalesced %s messages from %s", len(buffer.messages), phone)
+        self._reset(buffer)
+        buffer.running = True
+        buffer.done = job.done
+        job.done.add_done_callback(lambda _: self._on_done(phone))
+
+    @staticmethod
+    def _reset(buffer: _UserBuffer):
+        buffer.messages = []
+        buffer.deadline = None
+        buffer.first_at = None
+
+    def _drop(self, phone: str, buffer: _UserBuffer):
+        self._reset(buffer)
+        if not buffer.running:
+            del self._buffers[phone]
+
+    def _on_done(self, phone: str):
+        buffer = self._buffers.get(phone)
+        if buffer is None:
+            return
+        buffer.running = False
+        buffer.done = None
+        if buffer.messages and self._stopping:
+            self._flush(phone)
+        elif buffer.messages:
+            self._schedule(buffer)
+        else:
+            del self._buffers[phone]
+
+
+message_coalescer = MessageCoalescer(handler=message_service.arespond_and_send_message)
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import json
 import requests
@@ -5,6 +6,8 @@ from typing import BinaryIO
 from openai import OpenAI
 
 from app.schema import Audio, User
+from app.domain.user_directory import user_directory
+from app.domain.agents.dispatcher import DomainDispatcher
 from app.feature.finance.domain.agents.finance_agent import finance_agent
 from app.feature.relationships.domain.agents.relationships_agents import relationships_agent
 
@@ -15,6 +18,12 @@ WHATSAPP_API_KEY = os.getenv("WHATSAPP_API_TOKEN")
 MY_BUSINESS_TELEFONE = os.getenv("MY_BUSINESS_TELEFONE")
 llm = OpenAI()
 
+# Dominios atendidos pelo mesmo numero; novos dominios so precisam ser registrados aqui
+domain_dispatcher = DomainDispatcher({
+    "finance": finance_agent,
+    "relationships": relationships_agent,
+})
+
 def transcribe_audio_file(audio_file: BinaryIO) -> str:
     if not audio_file:
         return "No audio file provided"
@@ -65,13 +74,10 @@ def download_file_from_facebook(file_id: str, file_type: str, mime_type: str) ->
 
 
 def authenticate_user_by_phone_number(phone_number: str) -> User | None:
-    with open('allowed_users.json', 'r', encoding='utf-8') as file:
-        allowed_users =  json.load(file)
-               
-    for user in allowed_users:
-        if user["phone"] == phone_number:
-            print("authenticate_user_by_phone_number - got")
-            return User(**user)
+    user = user_directory.get_by_phone(phone_number)
+    if user:
+        print("authenticate_user_by_phone_number - got")
+        return user
     print("authenticate_user_by_phone_number - None")
     return None
 
@@ -111,14 +117,22 @@ def send_whatsapp_message(to, message, template=True):
 
 
 def respond_and_send_message(user_message: str, user: User):
-    # TODO: 
-    agent = relationships_agent
+    agent = domain_dispatcher
     response = agent.run(user_message, user.id)
     send_whatsapp_message(user.phone, response, template=False)
     print(f"Sent message to user {user.first_name} {user.last_name} ({user.phone})")
     print(f"Message: {response}")
 
 
+async def arespond_and_send_message(user_message: str, user: User):
+    """Versao assincrona: o agente aguarda o LLM sem ocupar uma thread do worker."""
+    agent = domain_dispatcher
+    response = await agent.arun(user_message, user.id)
+    await asyncio.to_thread(send_whatsapp_message, user.phone, response, template=False)
+    print(f"Sent message to user {user.first_name} {user.last_name} ({user.phone})")
+    print(f"Message: {response}")
+
+
 if __name__ == "__main__":
     #relationships_agent.run("Who is my contacts?", 1)
     print("\n\n\n")
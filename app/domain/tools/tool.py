@@ -1,12 +1,76 @@
+import asyncio
 from abc import abstractmethod
+from functools import cached_property, lru_cache
 from typing import Any, Optional, Type, Callable, Union
 
 from app.domain.tools.utils.utils import convert_to_openai_tool, convert_to_langchain_tool
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, PrivateAttr, TypeAdapter
 from sqlmodel import SQLModel
 
 from langchain_core.tools import BaseTool
 
+@lru_cache(maxsize=None)
+def _build_tool_schema(model: Type[BaseModel], name: str, exclude_keys: tuple, langchain: bool) -> dict:
+    """Schema da tool calculado uma unica vez por (model, name, exclude_keys). Nao modificar o retorno."""
+    schema = convert_to_langchain_tool(model) if langchain else convert_to_openai_tool(model)
+    schema["function"]["name"] = name
+    if schema["function"]["parameters"].get("required"):
+        del schema["function"]["parameters"]["required"]
+    schema["function"]["parameters"]["properties"] = {
+        key: value for key, value in schema["function"]["parameters"]["properties"].items()
+        if key not in exclude_keys
+    }
+    return schema
+
+def _parser(model) -> Callable[[dict], Any]:
+    """Funcao que transforma os kwargs da tool call na entrada de execute (parse_model=True)."""
+    if hasattr(model, "model_validate"):
+        # Modelos pydantic/SQLModel: model_validate ja usa o validador compilado da classe
+        return model.model_validate
+    try:
+        return TypeAdapter(model).validate_python
+    except Exception:
+        # Classe comum, sem schema pydantic
+        return lambda data: model(**data)
+
+
+class ValidationPlan:
+    """
+    O que _run precisa saber do model de uma tool, calculado uma unica vez:
+    campos obrigatorios (menos exclude_keys), como converter os kwargs e os schemas.
+    """
+
+    def __init__(self, model, name: str, exclude_keys: tuple, validate_missing: bool, parse_model: bool):
+        self.model = model
+        self.name = name
+        self.exclude_keys = exclude_keys
+        self.required: tuple = ()
+        if validate_missing and model is not None:
+            # Mesmo criterio do "required" do JSON schema: campos sem default, pelo alias
+            self.required = tuple(
+                field.alias or key for key, field in model.model_fields.items()
+                if field.is_required() and (field.alias or key) not in exclude_keys
+            )
+        self.parse: Optional[Callable[[dict], Any]] = _parser(model) if parse_model and model is not None else None
+
+    def missing(self, kwargs: dict) -> list:
+        return [field for field in self.required if field not in kwargs]
+
+    @cached_property
+    def langchain_schema(self) -> dict:
+        return _build_tool_schema(self.model, self.name, self.exclude_keys, langchain=True)
+
+    @cached_property
+    def openai_schema(self) -> dict:
+        return _build_tool_schema(self.model, self.name, self.exclude_keys, langchain=False)
+
+
+@lru_cache(maxsize=None)
+def compile_validation_plan(model, name: str, exclude_keys: tuple, validate_missing: bool,
+                            parse_model: bool) -> ValidationPlan:
+    return ValidationPlan(model, name, exclude_keys, validate_missing, parse_model)
+
+
 class ToolResult(BaseModel):
     content: str
     success: bool
@@ -20,70 +84,80 @@ class Tool(BaseTool):
     validate_missing: bool = True
     parse_model: bool = False
     exclude_keys: list[str] = ["id"]
+    # Tools somente leitura podem rodar em paralelo quando o modelo pede varias de uma vez
+    read_only: bool = False
+    # Resposta final renderizada localmente apos sucesso, ex.: "Added {first_name} {last_name}".
+    # Recebe os argumentos da chamada e {result}; usada por FinishPolicy.TEMPLATE
+    result_template: Optional[str] = None
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    # Plano de validacao da instancia (ver ValidationPlan)
+    _plan: Optional[ValidationPlan] = PrivateAttr(default=None)
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs):
+        super().__pydantic_init_subclass__(**kwargs)
+        # Compila o plano na definicao da classe; as instancias com os mesmos valores so o reaproveitam
+        fields = cls.model_fields
+        if not fields["model"].is_required() and not fields["name"].is_required():
+            compile_validation_plan(*cls._plan_key({
+                key: fields[key].get_default(call_default_factory=True)
+                for key in ("model", "name", "exclude_keys", "validate_missing", "parse_model")
+            }))
+
+    def model_post_init(self, context: Any):
+        super().model_post_init(context)
+        self._plan = compile_validation_plan(*self._plan_key(self.__dict__))
+
+    @staticmethod
+    def _plan_key(values: dict) -> tuple:
+        return (values["model"], values["name"], tuple(values["exclude_keys"]),
+                values["validate_missing"], values["parse_model"])
+
+    @property
+    def validation_plan(self) -> ValidationPlan:
+        return self._plan
+
     def _run(self, **kwargs) -> ToolResult:
         missing_values = self.validate_input(**kwargs)
         if missing_values:
             content = f"Missing values: {', '.join(missing_values)}"
             return ToolResult(content=content, success=False)
 
-        if self.parse_model:
-            if hasattr(self.model, "model_validate"):
-                input_ = self.model.model_validate(kwargs)
-            else:
-                input_ = self.model(**kwargs)
-            result = self.execute(input_)
+        if self._plan.parse is not None:
+            result = self.execute(self._plan.parse(kwargs))
         else:
             result = self.execute(**kwargs)
 
         return ToolResult(content=str(result), success=True)
     
-    def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+    async def _arun(self, **kwargs) -> ToolResult:
+        # As tools acessam o banco via SQLModel (sincrono): roda em thread para nao bloquear o event loop
+        return await asyncio.to_thread(self._run, **kwargs)
+
+    def render_result(self, args: dict, result: ToolResult) -> Optional[str]:
+        """Texto final da tool sem chamar o LLM, ou None se nao ha template ou faltam valores."""
+        if not self.result_template or not result.success:
+            return None
+        values = {key: value for key, value in args.items() if value is not None}
+        try:
+            return self.result_template.format(**values, result=result.content)
+        except (KeyError, IndexError, ValueError):
+            return None
 
     def validate_input(self, **kwargs):
-        if not self.validate_missing or not self.model:
-            return []
-         
-        # Obter schema do modelo com informações sobre campos obrigatórios
-        model_schema = self.model.model_json_schema()
-        required_fields = set(model_schema.get("required", []))
-        
-        # Campos que realmente são obrigatórios (sem valor padrão)
-        mandatory_fields = required_fields - set(self.exclude_keys)
-        
-        # Verificar campos obrigatórios
-        input_keys = set(kwargs.keys())
-        missing_values = mandatory_fields - input_keys
-        
-        return list(missing_values)
+        """Campos obrigatorios (sem default, fora de exclude_keys) ausentes nos kwargs."""
+        return self._plan.missing(kwargs)
 
     @property
     def openai_tool_schema(self):
-        schema = convert_to_openai_tool(self.model)
-        schema["function"]["name"] = self.name
-        if schema["function"]["parameters"].get("required"):
-            del schema["function"]["parameters"]["required"]
-        schema["function"]["parameters"]["properties"] = {
-            key: value for key, value in schema["function"]["parameters"]["properties"].items()
-            if key not in self.exclude_keys
-        }
-        return schema
+        return self._plan.openai_schema
 
     @property
     def langchain_tool_schema(self):
-        """Retorna o schema da tool no formato LangChain."""
-        schema = convert_to_langchain_tool(self.model)
-        schema["function"]["name"] = self.name
-        if schema["function"]["parameters"].get("required"):
-            del schema["function"]["parameters"]["required"]
-        schema["function"]["parameters"]["properties"] = {
-            key: value for key, value in schema["function"]["parameters"]["properties"].items()
-            if key not in self.exclude_keys
-        }
-        return schema
+        """Retorna o schema da tool no formato LangChain (calculado uma vez por plano)."""
+        return self._plan.langchain_schema
     
     @abstractmethod
     def execute(self, input_data: Any) -> Any:
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from app.schema import User
+
+USER_DIRECTORY_BACKEND = os.getenv("USER_DIRECTORY_BACKEND", "json")
+ALLOWED_USERS_FILE = os.getenv("ALLOWED_USERS_FILE", "allowed_users.json")
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", "users.db")
+# Intervalo minimo entre verificacoes do mtime do arquivo
+USER_DIRECTORY_CHECK_INTERVAL = float(os.getenv("USER_DIRECTORY_CHECK_INTERVAL", "1.0"))
+
+
+# 1. Interface do diretorio de usuarios
+class UserDirectory(ABC):
+    @abstractmethod
+    def get_by_phone(self, phone: str) -> Optional[User]:
+        pass
+
+    def load(self) -> None:
+        """Preparo feito no startup (fora do event loop), antes da primeira consulta."""
+        pass
+
+
+# 2. Implementações concretas
+class JsonUserDirectory(UserDirectory):
+    """
+    Carrega o allowed_users.json uma vez em um dict indexado por telefone e
+    so relê o arquivo quando o mtime muda.
+
+    load() faz a carga inicial e inicia uma thread que verifica o mtime a cada
+    check_interval; o novo indice e montado na thread e trocado de uma vez, entao
+    get_by_phone e so uma consulta ao dict (seguro para o event loop).
+    """
+
+    def __init__(self, filepath: Union[str, Path] = ALLOWED_USERS_FILE,
+                 check_interval: float = USER_DIRECTORY_CHECK_INTERVAL):
+        self.filepath = Path(filepath)
+        self.check_interval = check_interval
+        self._users: Optional[Dict[str, User]] = None
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def get_by_phone(self, phone: str) -> Optional[User]:
+        users = self._users
+        if users is None:
+            # Uso fora do app (scripts): carga sincrona na primeira consulta
+            self.load()
+            users = self._users
+        return users.get(phone)
+
+    def load(self) -> None:
+        self._refresh_if_changed()
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="user-directory", daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self._refresh_if_changed()
+            except Exception as e:
+                print(f"Failed to check {self.filepath}: {e}")
+
+    def _refresh_if_changed(self):
+        with self._lock:
+            try:
+                mtime = self.filepath.stat().st_mtime_ns
+            except FileNotFoundError:
+                self._users, self._mtime = {}, None
+                return
+            if mtime == self._mtime and self._users is not None:
+                return
+
+            try:
+                with open(self.filepath, 'r', encoding='utf-8') as file:
+                    allowed_users = json.load(file)
+            except json.JSONDecodeError as e:
+                # Arquivo sendo reescrito: mantem a versao anterior e tenta de novo depois
+                print(f"Failed to reload {self.filepath}: {e}")
+                if self._users is None:
+                    self._users = {}
+                return
+
+            # Indice novo montado por inteiro e trocado em uma atribuicao: leitores nunca veem um parcial
+            self._users = {user["phone"]: User(**user) for user in allowed_users}
+            self._mtime = mtime
+            print(f"Loaded {len(self._users)} allowed users from {self.filepath}")
+
+
+class SqliteUserDirectory(UserDirectory):
+    """Diretorio em tabela SQLite indexada por telefone, para allowlists grandes."""
+
+    def __init__(self, db_path: Union[str, Path] = USERS_DB_PATH):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS allowed_user ("
+            "phone TEXT PRIMARY KEY, id INTEGER NOT NULL, first_name TEXT NOT NULL, "
+            "last_name TEXT NOT NULL, role TEXT NOT NULL DEFAULT 'basic')"
+        )
+        self._connection.commit()
+
+    def get_by_phone(self, phone: str) -> Optional[User]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, first_name, last_name, phone, role FROM allowed_user WHERE phone = ?", (phone,)
+            ).fetchone()
+        return User(**dict(row)) if row else None
+
+    def import_json(self, filepath: Union[str, Path] = ALLOWED_USERS_FILE) -> int:
+        """Copia (upsert) os usuarios de um allowed_users.json para a tabela."""
+        with open(filepath, 'r', encoding='utf-8') as file:
+            users = [User(**user) for user in json.load(file)]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO allowed_user (phone, id, first_name, last_name, role) VALUES (?, ?, ?, ?, ?)",
+                [(u.phone, u.id, u.first_name, u.last_name, u.role.value) for u in users],
+            )
+            self._connection.commit()
+        return len(users)
+
+
+# 3. Factory
+def create_user_directory(backend: str = USER_DIRECTORY_BACKEND) -> UserDirectory:
+    if backend == "json":
+        return JsonUserDirectory()
+    if backend == "sqlite":
+        return SqliteUserDirectory()
+    raise ValueError(f"Backend de diretorio de usuarios nao suportado: {backend}. Use 'json' ou 'sqlite'.")
+
+
+user_directory = create_user_directory()
@@ -12,6 +12,7 @@ from app.feature.finance.domain.agents.routing import SYSTEM_MESSAGE as ROUTING_
 query_task_agent = TaskAgent(
     name="query_agent",
     description="An agent that can perform queries on multiple data sources",
+    keywords=["show", "list", "total", "expenses", "revenues", "customers", "mostrar", "quanto", "listar"],
     create_user_context=lambda: generate_query_context(Expense, Revenue, Customer),
     tools=[query_data_tool],
     system_message=TASK_SYSTEM_MESSAGE,
@@ -52,6 +53,7 @@ query_task_agent = TaskAgent(
 add_expense_agent = TaskAgent(
     name="add_expense_agent",
     description="An agent that can add an expense to the database",
+    keywords=["add expense", "spent", "paid", "bought", "cost", "new expense", "despesa", "gasto", "gastei", "paguei"],
     create_user_context=lambda: generate_query_context(Expense) + "\nRemarks: The tax rate is 0.19. The user provide the net amount you need to calculate the gross amount.",
     tools=[add_expense_tool],
     system_message=TASK_SYSTEM_MESSAGE
@@ -60,6 +62,7 @@ add_expense_agent = TaskAgent(
 add_revenue_agent = TaskAgent(
     name="add_revenue_agent",
     description="An agent that can add a revenue entry to the database",
+    keywords=["add revenue", "received", "earned", "income", "invoice paid", "sold", "receita", "recebi", "faturamento"],
     create_user_context=lambda: generate_query_context(Revenue) + "\nRemarks: The tax rate is 0.19. The user provide the gross_amount you should use the tax rate to calculate the net_amount.",
     tools=[add_revenue_tool],
     system_message=TASK_SYSTEM_MESSAGE
@@ -68,6 +71,7 @@ add_revenue_agent = TaskAgent(
 add_customer_agent = TaskAgent(
     name="add_customer_agent",
     description="An agent that can add a customer to the database",
+    keywords=["add customer", "new customer", "new client", "client", "novo cliente", "cliente"],
     create_user_context=lambda: generate_query_context(Customer),
     tools=[add_customer_tool],
     system_message=TASK_SYSTEM_MESSAGE
@@ -81,5 +85,6 @@ finance_agent = RoutingAgent(
         add_customer_agent
     ],
     system_message=ROUTING_SYSTEM_MESSAGE,
-    prompt_extra=PROMPT_EXTRA
+    prompt_extra=PROMPT_EXTRA,
+    databases=["finance"],
 )
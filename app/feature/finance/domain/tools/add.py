@@ -23,12 +23,13 @@ class AddExpenseTool(Tool):
     description: str = "Add an expense to the database. The tax rate is 0.19. User provides net amount, gross amount is calculated."
     args_schema: Type[BaseModel] = Expense
     model: Type[BaseModel] = Expense
+    result_template: str = "Expense added: {description}, net amount {net_amount}."
 
     def _run(self, **kwargs) -> ToolResult:
         return super()._run(**kwargs)
 
     async def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+        return await super()._arun(**kwargs)
     
     def execute(self, **kwargs) -> ToolResult:
         expense = Expense.model_validate(kwargs)
@@ -39,12 +40,13 @@ class AddRevenueTool(Tool):
     description: str = "Add a revenue entry to the database. The tax rate is 0.19. User provides gross_amount, net_amount is calculated."
     args_schema: Type[BaseModel] = Revenue
     model: Type[BaseModel] = Revenue
+    result_template: str = "Revenue added: {description}, gross amount {gross_amount}."
     
     def _run(self, **kwargs) -> ToolResult:
         return super()._run(**kwargs)
     
     async def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+        return await super()._arun(**kwargs)
     
     def execute(self, **kwargs) -> ToolResult:
         revenue = Revenue.model_validate(kwargs)
@@ -55,12 +57,13 @@ class AddCustomerTool(Tool):
     description: str = "Add a customer to the database"
     args_schema: Type[BaseModel] = Customer
     model: Type[BaseModel] = Customer
+    result_template: str = "Customer added: {first_name} {last_name}."
     
     def _run(self, **kwargs) -> ToolResult:
         return super()._run(**kwargs)
     
-    def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+    async def _arun(self, **kwargs) -> ToolResult:
+        return await super()._arun(**kwargs)
     
     def execute(self, **kwargs) -> ToolResult:
         customer = Customer.model_validate(kwargs)
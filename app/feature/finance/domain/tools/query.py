@@ -90,6 +90,7 @@ class QueryDataTool(Tool):
     description: str = "Query financial data from the database. Required: table_name (expense, revenue, customer). Optional: select_columns (defaults to all columns), where conditions for filtering. Example: {'table_name': 'expense'} will return all expense records with all columns."
     args_schema: Type[BaseModel] = QueryConfig
     model: Type[BaseModel] = QueryConfig
+    read_only: bool = True
     function: Callable = None
     parse_model: bool = True        # TODO: Para usar model.model_validate()
     validate_missing: bool = False  # TODO: Desabilitar validação
@@ -98,7 +99,7 @@ class QueryDataTool(Tool):
         return super()._run(**kwargs)
         
     async def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+        return await super()._arun(**kwargs)
     
     def execute(self, input_data: QueryConfig) -> ToolResult:
         query_config = input_data
@@ -1,12 +1,16 @@
 import os
 from sqlmodel import SQLModel, create_engine
 
+from app.infrastructure.answer_cache import answer_cache
+
 from app.feature.finance.persistence.models import *
 
 # local stored database
 DATABASE_URL = r"sqlite:///" + os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))), "finance_app.db")
 
 engine = create_engine(DATABASE_URL, echo=False)
+# Escritas neste banco invalidam as respostas cacheadas dos agentes de finance
+answer_cache.watch("finance", engine)
 
 def create_db_and_tables():
     """Cria as tabelas específicas do módulo finance."""
@@ -16,6 +16,7 @@ from app.feature.relationships.domain.agents.routing import SYSTEM_MESSAGE as RO
 query_relationships_agent = TaskAgent(
     name="query_relationships_agent",
     description="Agent that can query people, interactions and upcoming reminders",
+    keywords=["who", "contacts", "list", "show", "find", "search", "upcoming", "last talked", "contatos", "quem", "mostrar"],
     tools=[
         query_people_tool,
         query_interactions_tool,
@@ -70,6 +71,7 @@ query_relationships_agent = TaskAgent(
 add_person_agent = TaskAgent(
     name="add_person_agent",
     description="Agent that can add a person to the database",
+    keywords=["add contact", "new contact", "new person", "save contact", "adicionar contato", "novo contato"],
     tools=[add_person_tool],
     system_message=TASK_SYSTEM_MESSAGE
 )
@@ -78,6 +80,7 @@ add_person_agent = TaskAgent(
 log_interaction_agent = TaskAgent(
     name="log_interaction_agent",
     description="Agent that can log an interaction for a person",
+    keywords=["log", "met", "talked", "called", "caught up", "meeting with", "conversei", "encontrei", "liguei"],
     tools=[log_interaction_tool],
     system_message=TASK_SYSTEM_MESSAGE
 )
@@ -86,6 +89,7 @@ log_interaction_agent = TaskAgent(
 schedule_reminder_agent = TaskAgent(
     name="schedule_reminder_agent",
     description="Agent that can schedule reminders for a person",
+    keywords=["remind", "reminder", "schedule", "follow up", "lembrar", "lembrete", "agendar"],
     tools=[schedule_reminder_tool],
     system_message=TASK_SYSTEM_MESSAGE
 )
@@ -99,5 +103,6 @@ relationships_agent = RoutingAgent(
         schedule_reminder_agent,
     ],
     system_message=ROUTING_SYSTEM_MESSAGE,
-    prompt_extra=PROMPT_EXTRA
+    prompt_extra=PROMPT_EXTRA,
+    databases=["relationships"],
 )
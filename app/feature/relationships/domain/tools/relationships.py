@@ -22,12 +22,13 @@ class AddPersonTool(Tool):
     description: str = "Add a new person to your contacts database"
     args_schema: Type[BaseModel] = AddPerson
     model: Type[BaseModel] = AddPerson
+    result_template: str = "Added {first_name} {last_name} to your contacts."
     
     def _run(self, **data) -> ToolResult:
         return super()._run(**data)
     
     async def _arun(self, **data) -> ToolResult:
-        return self._run(**data)
+        return await super()._arun(**data)
     
     def execute(self, **data) -> ToolResult:
         with Session(engine) as session:
@@ -51,12 +52,13 @@ class LogInteractionTool(Tool):
     description: str = "Log an interaction with a person in your contacts"
     args_schema: Type[BaseModel] = LogInteraction
     model: Type[BaseModel] = LogInteraction
+    result_template: str = "Interaction logged: {type} via {channel} on {date}."
     
     def _run(self, **data) -> ToolResult:
         return super()._run(**data)
     
     async def _arun(self, **data) -> ToolResult:
-        return self._run(**data)
+        return await super()._arun(**data)
     
     def execute(self, **data) -> ToolResult:
         with Session(engine) as session:
@@ -77,6 +79,7 @@ class ScheduleReminderTool(Tool):
     description: str = "Schedule a reminder for a person"
     args_schema: Type[BaseModel] = ScheduleReminder
     model: Type[BaseModel] = ScheduleReminder
+    result_template: str = "Reminder scheduled for {due_date}: {reason}."
     function: Callable = None
     parse_model: bool = True 
     
@@ -84,7 +87,7 @@ class ScheduleReminderTool(Tool):
         return super()._run(**data)
     
     async def _arun(self, **data) -> ToolResult:
-        return self._run(**data)
+        return await super()._arun(**data)
 
     def execute(self, **data) -> ToolResult:
         with Session(engine) as session:
@@ -105,12 +108,13 @@ class QueryPeopleTool(Tool):
     description: str = "Search for people in your contacts. You can search by name (first or last name) or by tags. Both parameters are optional - if neither is provided, all contacts will be returned."
     args_schema: Type[BaseModel] = QueryPeople
     model: Type[BaseModel] = QueryPeople
+    read_only: bool = True
     
     def _run(self, **kwargs) -> ToolResult:
         return super()._run(**kwargs)
     
     async def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+        return await super()._arun(**kwargs)
     
     def execute(self, **kwargs) -> ToolResult:
         name_contains = kwargs.get("name_contains")
@@ -134,12 +138,13 @@ class QueryInteractionsTool(Tool):
     description: str = "Search for interaction history with optional filters"
     args_schema: Type[BaseModel] = QueryInteractions
     model: Type[BaseModel] = QueryInteractions
+    read_only: bool = True
     
     def _run(self, **kwargs) -> ToolResult:
         return super()._run(**kwargs)
     
     async def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+        return await super()._arun(**kwargs)
     
     def execute(self, **kwargs) -> ToolResult:
         with Session(engine) as session:
@@ -161,12 +166,13 @@ class UpcomingRemindersTool(Tool):
     description: str = "Get reminders due in the next specified number of days (default: 7 days)"
     args_schema: Type[BaseModel] = UpcomingReminders
     model: Type[BaseModel] = UpcomingReminders
+    read_only: bool = True
     
     def _run(self, **kwargs) -> ToolResult:
         return super()._run(**kwargs)
     
     async def _arun(self, **kwargs) -> ToolResult:
-        return self._run(**kwargs)
+        return await super()._arun(**kwargs)
     
     def execute(self, **kwargs) -> ToolResult:
         from datetime import datetime, timedelta
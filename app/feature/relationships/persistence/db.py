@@ -1,12 +1,16 @@
 import os
 from sqlmodel import SQLModel, create_engine
 
+from app.infrastructure.answer_cache import answer_cache
+
 from app.feature.relationships.persistence.models import *
 
 # local stored database
 DATABASE_URL = r"sqlite:///" + os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))), "relationships_app.db")
 
 engine = create_engine(DATABASE_URL, echo=False)
+# Escritas neste banco invalidam as respostas cacheadas dos agentes de relationships
+answer_cache.watch("relationships", engine)
 
 def create_db_and_tables():
     """Cria as tabelas específicas do módulo relationships."""
@@ -0,0 +1,121 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Limite de seguranca para respostas que dependem da data (ex.: lembretes dos proximos dias)
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600"))
+ANSWER_CACHE_MAX_SIZE = int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1000"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """ "  Who are my   contacts?? " -> "who are my contacts" """
+    return _WHITESPACE_RE.sub(" ", message.lower()).strip().rstrip("?!.").strip()
+
+
+class _WatchedDatabase:
+    """
+    Versao de um banco: commits feitos pelo engine do app (evento "commit" do
+    SQLAlchemy) + PRAGMA data_version, que muda quando qualquer outra conexao
+    (outro worker, scripts de mock_data) grava no arquivo SQLite.
+    """
+
+    def __init__(self, engine: Engine):
+        self.commits = 0
+        self._path = engine.url.database if engine.url.get_backend_name() == "sqlite" else None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_commit(self, _connection):
+        self.commits += 1
+
+    def version(self) -> Tuple[int, int]:
+        return self.commits, self._data_version()
+
+    def _data_version(self) -> int:
+        if not self._path:
+            return 0
+        with self._lock:
+            if self._connection is None:
+                try:
+                    # Somente leitura: nao cria o arquivo se o banco ainda nao existe
+                    self._connection = sqlite3.connect(f"file:{self._path}?mode=ro", uri=True, check_same_thread=False)
+                except sqlite3.OperationalError:
+                    return 0
+            return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+class AnswerCache:
+    """
+    Respostas finais por (usuario, mensagem normalizada, agente).
+
+    Cada entrada guarda a versao dos bancos lidos pelo agente no inicio da
+    execucao; qualquer escrita posterior nesses bancos invalida a entrada.
+    Execucoes que escreveram no banco nao sao guardadas.
+    """
+
+    def __init__(self, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS, max_size: int = ANSWER_CACHE_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._databases: Dict[str, _WatchedDatabase] = {}
+        self._entries: OrderedDict[tuple, Tuple[float, tuple, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def watch(self, name: str, engine: Engine):
+        """Registra um banco cujas escritas invalidam as respostas que dependem dele."""
+        if name not in self._databases:
+            self._databases[name] = _WatchedDatabase(engine)
+
+    def versions(self, databases: Optional[Iterable[str]] = None) -> tuple:
+        names = sorted(self._databases if databases is None else databases)
+        return tuple((name, self._databases[name].version()) for name in names if name in self._databases)
+
+    def get(self, user_id, message: str, agent: str, databases: Optional[Iterable[str]] = None) -> Optional[str]:
+        key = (user_id, normalize_message(message), agent)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, versions, answer = entry
+            if expires_at > time.monotonic() and versions == self.versions(databases):
+                with self._lock:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                return answer
+            with self._lock:
+                self._entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def set(self, user_id, message: str, agent: str, answer: str, versions: tuple,
+            databases: Optional[Iterable[str]] = None):
+        """Guarda a resposta se os bancos continuam na versao de antes da execucao (nada foi escrito)."""
+        if versions != self.versions(databases):
+            return
+        key = (user_id, normalize_message(message), agent)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, versions, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+answer_cache = AnswerCache()
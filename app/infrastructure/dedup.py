@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Union
+
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "memory")
+DEDUP_TTL_SECONDS = float(os.getenv("DEDUP_TTL_SECONDS", "3600"))
+DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", "10000"))
+DEDUP_DB_PATH = os.getenv(
+    "DEDUP_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "webhook_dedup.db"),
+)
+
+
+# 1. Interface para os stores de ids ja vistos
+class SeenMessageStore(ABC):
+    @abstractmethod
+    def add_if_new(self, message_id: str) -> bool:
+        """Registra o id e retorna True se ele ainda nao tinha sido visto (ou expirou)."""
+        pass
+
+    @abstractmethod
+    def discard(self, message_id: str) -> None:
+        """Esquece o id, para que uma nova entrega da Meta volte a ser processada."""
+        pass
+
+
+# 2. Implementações concretas
+class InMemorySeenMessageStore(SeenMessageStore):
+    """TTL + LRU em memoria, suficiente para um unico processo."""
+
+    def __init__(self, ttl_seconds: float = DEDUP_TTL_SECONDS, max_size: int = DEDUP_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._expires_at: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_if_new(self, message_id: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._expires_at.get(message_id)
+            if expires_at is not None and expires_at > now:
+                self._expires_at.move_to_end(message_id)
+                return False
+
+            self._expires_at[message_id] = now + self.ttl_seconds
+            self._expires_at.move_to_end(message_id)
+            while len(self._expires_at) > self.max_size:
+                self._expires_at.popitem(last=False)
+            return True
+
+    def discard(self, message_id: str) -> None:
+        with self._lock:
+            self._expires_at.pop(message_id, None)
+
+
+class SqliteSeenMessageStore(SeenMessageStore):
+    """Store compartilhado entre workers/processos atraves de um arquivo SQLite."""
+
+    _PURGE_EVERY = 500
+
+    def __init__(self, db_path: Union[str, Path] = DEDUP_DB_PATH, ttl_seconds: float = DEDUP_TTL_SECONDS):
+        self.db_path = str(db_path)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS seen_message (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+
+    def add_if_new(self, message_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            # Insere o id ou renova um registro expirado; rowcount == 0 significa duplicado
+            cursor = self._connection.execute(
+                "INSERT INTO seen_message (id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET expires_at = excluded.expires_at "
+                "WHERE seen_message.expires_at <= ?",
+                (message_id, now + self.ttl_seconds, now),
+            )
+            is_new = cursor.rowcount > 0
+            if is_new:
+                self._inserts += 1
+                if self._inserts % self._PURGE_EVERY == 0:
+                    self._connection.execute("DELETE FROM seen_message WHERE expires_at <= ?", (now,))
+            return is_new
+
+    def discard(self, message_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM seen_message WHERE id = ?", (message_id,))
+
+
+# 3. Factory
+def create_seen_message_store(backend: str = DEDUP_BACKEND) -> SeenMessageStore:
+    if backend == "memory":
+        return InMemorySeenMessageStore()
+    if backend == "sqlite":
+        return SqliteSeenMessageStore()
+    raise ValueError(f"Backend de deduplicacao nao suportado: {backend}. Use 'memory' ou 'sqlite'.")
+
+
+seen_messages = create_seen_message_store()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from app.domain.exceptions import QueueFullError
+
+log = logging.getLogger(__name__)
+
+# Jobs assincronos so ocupam um worker enquanto aguardam I/O, entao o padrao pode ser alto;
+# as threads do executor (jobs sincronos) sao criadas sob demanda
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "100"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+
+
+class Job:
+    """Unidade de trabalho enfileirada pelo webhook."""
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, deadline: Optional[float] = None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        # Timestamp absoluto (epoch) apos o qual o job nao deve mais rodar
+        self.deadline = deadline
+        self.enqueued_at = time.time()
+        # Resolvido com o status final ("completed", "failed", ...) quando o job termina
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+
+class JobQueue:
+    """
+    Fila asyncio com um numero fixo de workers.
+
+    Corrotinas rodam direto no event loop (e sao canceladas ao estourar o
+    deadline). Os jobs sincronos rodam em um ThreadPoolExecutor dedicado com o
+    mesmo numero de threads que workers, entao o processamento dos agentes
+    nunca disputa o threadpool do Starlette (que continua livre para /health).
+    """
+
+    def __init__(self, workers: int = JOB_QUEUE_WORKERS, max_size: int = JOB_QUEUE_MAX_SIZE):
+        self.workers = workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = 0
+        self._counters = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "expired": 0, "timed_out": 0}
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None
+
+    async def start(self):
+        if self.started:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job-worker")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        log.info("Job queue started with %s workers (max_size=%s)", self.workers, self.max_size)
+
+    async def stop(self):
+        if not self.started:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._tasks = []
+        self._queue = None
+        self._executor = None
+
+    def depth(self) -> int:
+        """Jobs aguardando um worker."""
+        return self._queue.qsize() if self.started else 0
+
+    def is_full(self) -> bool:
+        return self.started and self._queue.full()
+
+    def submit(self, func: Callable, *args, deadline: Optional[float] = None, **kwargs) -> Job:
+        """Enfileira um job sem bloquear. Levanta QueueFullError se nao houver espaco."""
+        if not self.started:
+            raise RuntimeError("Job queue is not started")
+
+        job = Job(func, args, kwargs, deadline=deadline)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            raise QueueFullError(self.max_size, "Job queue is full")
+
+        self._counters["accepted"] += 1
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "depth": self.depth(),
+            "running": self._running,
+            **self._counters,
+        }
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            status = "cancelled"
+            try:
+                status = await self._execute(job)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+                if not job.done.done():
+                    job.done.set_result(status)
+
+    async def _execute(self, job: Job) -> str:
+        timeout = job.remaining()
+        if timeout is not None and timeout <= 0:
+            self._counters["expired"] += 1
+            log.warning("Dropping job %s: deadline expired while queued", getattr(job.func, "__name__", job.func))
+            return "expired"
+
+        if asyncio.iscoroutinefunction(job.func):
+            awaitable = job.func(*job.args, **job.kwargs)
+        else:
+            loop = asyncio.get_running_loop()
+            awaitable = loop.run_in_executor(self._executor, partial(job.func, *job.args, **job.kwargs))
+
+        try:
+            await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            # A thread continua ate terminar, mas o worker fica livre para o proximo job
+            self._counters["timed_out"] += 1
+            log.warning("Job %s exceeded its deadline", getattr(job.func, "__name__", job.func))
+            return "timed_out"
+        except Exception:
+            self._counters["failed"] += 1
+            log.exception("Job %s failed", getattr(job.func, "__name__", job.func))
+            return "failed"
+
+        self._counters["completed"] += 1
+        return "completed"
+
+
+job_queue = JobQueue()
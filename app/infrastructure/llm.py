@@ -1,7 +1,14 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
+import asyncio
+import heapq
+import importlib
+import itertools
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Dict, Iterable, List, Optional
 
 from dotenv import load_dotenv
 import os
@@ -11,11 +18,12 @@ _ = load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Os SDKs dos provedores so sao importados quando um modelo deles e criado
 _PROVIDER_MAP = {
-    "openai": ChatOpenAI,
-    "google": ChatGoogleGenerativeAI,
-    "groq": ChatGroq,
-    "ollama": ChatOllama,
+    "openai": ("langchain_openai", "ChatOpenAI"),
+    "google": ("langchain_google_genai", "ChatGoogleGenerativeAI"),
+    "groq": ("langchain_groq", "ChatGroq"),
+    "ollama": ("langchain_ollama", "ChatOllama"),
 }
 
 MODEL_CONFIGS = [
@@ -23,14 +31,16 @@ MODEL_CONFIGS = [
         "key_name": "ogptoss20b", # um pouco lento, mas funcionou de primeira
         "provider": "ollama",
         "model_name": "gpt-oss:20b",
-        "temprature": 0,
+        "temperature": 0,
+        "context_window": 8192,  # num_ctx padrao do servidor ollama, nao o limite do modelo
         "validate_model_on_init": True,
     },
     {
         "key_name": "dsr1llama70b",
         "provider": "groq",
         "model_name": "deepseek-r1-distill-llama-70b", #"mixtral-8x7b-32768"  # Melhor para raciocínio
-        "temprature": 0,
+        "temperature": 0,
+        "context_window": 131072,
         "max_tokens": 1000,    # Contexto adequado
         "top_p": 0.1,         # Reduzir aleatoriedade
        # "frequency_penalty": 0.1,  # Evitar repetições
@@ -40,7 +50,8 @@ MODEL_CONFIGS = [
         "key_name": "llama388b8192",
         "provider": "groq",
         "model_name": "llama3-8b-8192",  # Mais rápido para execução, Nao é bom para trabalhar com chamadas de tools em cadeia
-        "temprature": 0,
+        "temperature": 0,
+        "context_window": 8192,
         "max_tokens": 500,  # Limitar para foco
         "top_p": 0.1,      # Reduzir aleatoriedade
     },
@@ -48,31 +59,36 @@ MODEL_CONFIGS = [
         "key_name": "g25flash", # Topzera e custo beneficio
         "provider" : "google",
         "model_name": "gemini-2.5-flash",
-        "temprature": 0,
+        "temperature": 0,
+        "context_window": 1048576,
     },
     {
         "key_name":"3.5-turbo", # Nao é eficiente para o uso e chamada de ferramentas
         "provider":"openai",
         "model_name":"gpt-3.5-turbo",
+        "context_window": 16385,
     },
     {
         "key_name": "o4", # Melhor custo beneficio
         "provider": "openai",
         "model_name": "o4-mini-2025-04-16",
+        "context_window": 200000,
     },
     {
         "key_name": "gpt_4o", # Topzera
         "provider": "openai",
         "model_name": "gpt-4o-2024-08-06",
+        "context_window": 128000,
     },
 ]
 
-def _create_chat_model(model_name: str, provider: str, temperature: float | None = None):
+def _create_chat_model(model_name: str, provider: str, temperature: float | None = None, **extra_params):
     if provider not in _PROVIDER_MAP:
         raise ValueError(f"Provedor nao suportado: {provider}. Provedores suportados sao: {list(_PROVIDER_MAP.keys())}")
 
-    model_class = _PROVIDER_MAP[provider]
-    params = {"model": model_name}
+    module_name, class_name = _PROVIDER_MAP[provider]
+    model_class = getattr(importlib.import_module(module_name), class_name)
+    params = {"model": model_name, **extra_params}
     if temperature is not None:
         params["temperature"] = temperature
 
@@ -90,16 +106,311 @@ def _create_chat_model(model_name: str, provider: str, temperature: float | None
 
     return model_class(**params)
 
-models = {}
+class ModelRegistry(Mapping):
+    """
+    Registro lazy dos chat models de MODEL_CONFIGS.
 
-for config in MODEL_CONFIGS:
-    models[config["key_name"]] = _create_chat_model(
-        model_name=config["model_name"],
-        provider=config["provider"],
-        temperature=config.get("temperature")
+    Cada modelo so e construido no primeiro acesso (models[key]) e fica em cache.
+    Assim um provedor sem chave configurada so falha quando de fato e usado.
+    """
+
+    def __init__(self, configs: List[Dict[str, Any]]):
+        self._configs: Dict[str, Dict[str, Any]] = {config["key_name"]: dict(config) for config in configs}
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str):
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                config = self._configs[key]
+                model = _create_chat_model(
+                    model_name=config["model_name"],
+                    provider=config["provider"],
+                    temperature=config.get("temperature"),
+                    **config.get("params", {}),
+                )
+                self._models[key] = model
+        return model
+
+    def __iter__(self):
+        return iter(self._configs)
+
+    def __len__(self):
+        return len(self._configs)
+
+    def get_config(self, key: str) -> Dict[str, Any]:
+        return dict(self._configs[key])
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._models
+
+    def configure(self, key: str, **overrides):
+        """
+        Sobrescreve a configuracao de um modelo em tempo de execucao (ou registra um novo).
+        A instancia em cache e descartada e recriada no proximo acesso.
+        """
+        with self._lock:
+            config = {**self._configs.get(key, {"key_name": key}), **overrides}
+            if "provider" not in config or "model_name" not in config:
+                raise ValueError(f"Modelo {key} precisa de 'provider' e 'model_name'")
+            self._configs[key] = config
+            self._models.pop(key, None)
+
+    def preload(self, keys: Iterable[str]) -> List[str]:
+        """Constroi antecipadamente os modelos informados (ex: no startup do servidor)."""
+        loaded = []
+        for key in keys:
+            try:
+                self[key]
+                loaded.append(key)
+            except Exception as e:
+                print(f"Failed to preload model {key}: {e}")
+        return loaded
+
+
+models = ModelRegistry(MODEL_CONFIGS)
+
+
+# --- Limites de concorrencia por provedor ---
+
+class Priority(IntEnum):
+    """Ordem de atendimento na fila de cada provedor (menor = antes)."""
+    ROUTING = 0
+    INTERACTIVE = 1
+    BACKGROUND = 2
+
+
+_llm_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+def current_priority() -> Priority:
+    return _llm_priority.get()
+
+
+# Instante (time.monotonic()) a partir do qual as chamadas ao LLM do contexto atual desistem
+_llm_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+def remaining_time() -> Optional[float]:
+    """Segundos ate o deadline do contexto atual (pode ser negativo), ou None se nao ha deadline."""
+    deadline = _llm_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def llm_deadline(deadline: Optional[float]):
+    """Limita as chamadas ao LLM feitas dentro do bloco a deadline (time.monotonic()); None nao limita."""
+    current = _llm_deadline.get()
+    if deadline is not None and current is not None:
+        deadline = min(deadline, current)
+    token = _llm_deadline.set(deadline if deadline is not None else current)
+    try:
+        yield
+    finally:
+        _llm_deadline.reset(token)
+
+
+@contextmanager
+def llm_priority(priority: Priority):
+    """Define a prioridade das chamadas ao LLM feitas dentro do bloco (thread ou task atual)."""
+    token = _llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _llm_priority.reset(token)
+
+
+# Concorrencia inicial por provedor; LLM_CONCURRENCY="ollama=2,groq=8" sobrescreve
+PROVIDER_CONCURRENCY = {
+    "ollama": 2,  # uma GPU local: mais chamadas so aumentam a fila interna
+    "groq": 8,
+    "google": 16,
+    "openai": 16,
+}
+PROVIDER_CONCURRENCY.update({
+    provider.strip(): int(limit)
+    for provider, limit in (
+        item.split("=") for item in os.getenv("LLM_CONCURRENCY", "").split(",") if "=" in item
     )
+})
+DEFAULT_CONCURRENCY = 8
+
+_OVERLOAD_MARKERS = ("429", "rate limit", "ratelimit", "resourceexhausted", "resource_exhausted", "overloaded", "503")
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Erros que indicam provedor saturado (429, quota, timeout) e devem reduzir o limite."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _OVERLOAD_MARKERS)
+
+
+class _Waiter:
+    __slots__ = ("event", "future", "loop", "granted", "cancelled")
+
+    def __init__(self, event: Optional[threading.Event] = None, future=None, loop=None):
+        self.event = event
+        self.future = future
+        self.loop = loop
+        self.granted = False
+        self.cancelled = False
+
+
+class AdaptiveLimiter:
+    """
+    Limite de chamadas simultaneas a um provedor, ajustado por AIMD: cada
+    sucesso soma 1/limite (aprox. +1 por "janela"), e sinais de saturacao
+    (429, timeout) dividem o limite por 2 no maximo uma vez por janela.
+
+    Quem espera fica em uma fila de prioridade (Priority), compartilhada entre
+    threads e corrotinas.
+    """
+
+    def __init__(self, name: str, limit: int, min_limit: int = 1, max_limit: Optional[int] = None):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit or limit * 4
+        self.limit = float(limit)
+        # Momento (time.monotonic()) da ultima reducao do limite
+        self._decreased_at = float("-inf")
+        self._in_flight = 0
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._has_capacity():
+                self._in_flight += 1
+                return True
+            waiter = _Waiter(event=threading.Event())
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+
+        if waiter.event.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            return False
+
+    async def acquire_async(self, priority: Priority = Priority.INTERACTIVE):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._has_capacity():
+                self._in_flight += 1
+                return
+            waiter = _Waiter(future=loop.create_future(), loop=loop)
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_waiters()
+
+    def record(self, overloaded: bool, started: Optional[float] = None):
+        """
+        Resultado de uma chamada iniciada em started (time.monotonic()). Falhas de
+        chamadas que comecaram antes da ultima reducao ja estao refletidas nela:
+        uma rajada de 429 simultaneos divide o limite uma vez so.
+        """
+        with self._lock:
+            if overloaded:
+                if started is not None and started < self._decreased_at:
+                    return
+                self.limit = max(float(self.min_limit), self.limit / 2)
+                self._decreased_at = time.monotonic()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+                self._grant_waiters()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self._in_flight,
+            "waiting": sum(1 for _, _, waiter in self._waiters if not waiter.cancelled),
+        }
+
+    def _has_capacity(self) -> bool:
+        while self._waiters and self._waiters[0][2].cancelled:
+            heapq.heappop(self._waiters)
+        return self._in_flight < int(self.limit) and not self._waiters
+
+    def _grant_waiters(self):
+        while self._waiters and self._in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self._in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def provider_limiter(provider: str) -> AdaptiveLimiter:
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                limiter = AdaptiveLimiter(provider, PROVIDER_CONCURRENCY.get(provider, DEFAULT_CONCURRENCY))
+                _limiters[provider] = limiter
+    return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {provider: limiter.stats() for provider, limiter in _limiters.items()}
 
 LLM = "ogptoss20b"
 
+# Modelo de cada papel (chaves de MODEL_CONFIGS). Escolher um entre poucos agentes
+# pede bem menos que encadear tools: o roteamento pode usar um modelo rapido e barato.
+MODEL_TIERS = {
+    "routing": os.getenv("LLM_ROUTING", LLM),
+    "execution": os.getenv("LLM_EXECUTION", LLM),
+    # Modelo mais forte assumido apos uma tool call com falha; vazio = sem escalonamento
+    "escalation": os.getenv("LLM_ESCALATION", ""),
+}
+
+
+def resolve_model(name: Optional[str]) -> Optional[str]:
+    """Tier ("routing", "execution", "escalation") ou chave de MODEL_CONFIGS -> chave de MODEL_CONFIGS."""
+    return MODEL_TIERS.get(name, name) or None
+
+
+# Modelos construidos no startup para evitar latencia na primeira requisicao
+LLM_PRELOAD = [
+    key.strip()
+    for key in os.getenv("LLM_PRELOAD", ",".join(dict.fromkeys([MODEL_TIERS["routing"], MODEL_TIERS["execution"]]))).split(",")
+    if key.strip()
+]
+
 if __name__ == "__main__":
     print()
\ No newline at end of file
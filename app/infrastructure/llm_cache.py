@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Mapping, Optional, Sequence, Tuple, Union
+
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+
+from app.infrastructure.model_router import answered_by
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+# memory (LRU por processo) | sqlite (LRU em memoria + arquivo compartilhado entre processos)
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "1000"))
+LLM_CACHE_DB_PATH = os.getenv(
+    "LLM_CACHE_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "llm_cache.db"),
+)
+
+
+def cache_key(model_key: str, messages: Sequence[BaseMessage], tool_schemas: Sequence[dict] = ()) -> str:
+    """Hash estavel de (modelo, mensagens, schemas das tools vinculadas)."""
+    payload = {
+        "model": model_key,
+        "messages": [message_to_dict(message) for message in messages],
+        "tools": list(tool_schemas),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(llm: Mapping[str, Any], model_key: str) -> bool:
+    """So respostas de modelos com temperature 0 sao reaproveitadas."""
+    get_config = getattr(llm, "get_config", None)
+    if get_config is None:
+        return False
+    try:
+        return get_config(model_key).get("temperature") == 0
+    except KeyError:
+        return False
+
+
+class ResponseCache:
+    """
+    Cache exato de respostas do LLM: LRU + TTL em memoria e, opcionalmente,
+    uma tabela SQLite para sobreviver a restarts e ser compartilhada entre workers.
+    """
+
+    _PURGE_EVERY = 500
+
+    def __init__(
+            self,
+            ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+            max_size: int = LLM_CACHE_MAX_SIZE,
+            db_path: Union[str, Path, None] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Tuple[float, AIMessage]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._connection = None
+        if db_path:
+            self._connection = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response (key TEXT PRIMARY KEY, message TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT message, expires_at FROM llm_response WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    message = messages_from_dict([json.loads(row[0])])[0]
+                    self._remember(key, row[1], message)
+                    self.hits += 1
+                    return message
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, message: AIMessage):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, message)
+            if self._connection is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO llm_response (key, message, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(message_to_dict(message), default=str), expires_at),
+                )
+                self._inserts += 1
+                if self._inserts % self._PURGE_EVERY == 0:
+                    self._connection.execute("DELETE FROM llm_response WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM llm_response")
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remember(self, key: str, expires_at: float, message: AIMessage):
+        self._entries[key] = (expires_at, message)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+def create_response_cache(backend: str = LLM_CACHE_BACKEND) -> ResponseCache:
+    if backend == "memory":
+        return ResponseCache()
+    if backend == "sqlite":
+        return ResponseCache(db_path=LLM_CACHE_DB_PATH)
+    raise ValueError(f"Backend de cache de LLM nao suportado: {backend}. Use 'memory' ou 'sqlite'.")
+
+
+response_cache = create_response_cache()
+
+
+def _lookup(llm: Mapping[str, Any], model_key: str, messages: List[BaseMessage], tool_schemas: Sequence[dict],
+            use_cache: bool) -> Tuple[Optional[str], Optional[AIMessage]]:
+    if not (use_cache and LLM_CACHE_ENABLED and is_deterministic(llm, model_key)):
+        return None, None
+    key = cache_key(model_key, messages, tool_schemas)
+    return key, response_cache.get(key)
+
+
+def _cacheable(key: Optional[str], response: AIMessage, model_key: str) -> bool:
+    # Resposta de um fallback (failover do ModelRouter) nao e a resposta deterministica do modelo pedido
+    answered = answered_by(response)
+    return key is not None and (answered is None or answered == model_key)
+
+
+def invoke_cached(runnable, messages: List[BaseMessage], llm: Mapping[str, Any], model_key: str,
+                  tool_schemas: Sequence[dict] = (), use_cache: bool = True) -> AIMessage:
+    """runnable.invoke(messages) com cache exato para modelos deterministicos."""
+    key, cached = _lookup(llm, model_key, messages, tool_schemas, use_cache)
+    if cached is not None:
+        return cached
+    response = runnable.invoke(messages)
+    if _cacheable(key, response, model_key):
+        response_cache.set(key, response)
+    return response
+
+
+async def ainvoke_cached(runnable, messages: List[BaseMessage], llm: Mapping[str, Any], model_key: str,
+                         tool_schemas: Sequence[dict] = (), use_cache: bool = True) -> AIMessage:
+    """Versao assincrona de invoke_cached."""
+    key, cached = _lookup(llm, model_key, messages, tool_schemas, use_cache)
+    if cached is not None:
+        return cached
+    response = await runnable.ainvoke(messages)
+    if _cacheable(key, response, model_key):
+        response_cache.set(key, response)
+    return response
@@ -0,0 +1,385 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Mapping, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from app.domain.exceptions import LLMUnavailableError
+from app.infrastructure.llm import (
+    LLM, AdaptiveLimiter, Priority, current_priority, is_overload_error, models, provider_limiter, remaining_time,
+)
+
+# Modelos tentados, em ordem, quando o principal (LLM) falha ou estoura o timeout
+LLM_FALLBACKS = [key.strip() for key in os.getenv("LLM_FALLBACKS", "").split(",") if key.strip()]
+# Dispara o primeiro fallback em paralelo quando o principal demora mais que o seu p95
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Erros seguidos para tirar um modelo de rotacao, e por quanto tempo
+LLM_MAX_CONSECUTIVE_ERRORS = int(os.getenv("LLM_MAX_CONSECUTIVE_ERRORS", "3"))
+LLM_COOLDOWN_SECONDS = float(os.getenv("LLM_COOLDOWN_SECONDS", "30"))
+LLM_ROUTER_WORKERS = int(os.getenv("LLM_ROUTER_WORKERS", "32"))
+
+# Timeout padrao por provedor; MODEL_CONFIGS pode sobrescrever com "timeout"
+PROVIDER_TIMEOUTS = {
+    "ollama": 120.0,  # modelo local pode estar frio
+    "groq": 20.0,
+    "google": 30.0,
+    "openai": 30.0,
+}
+DEFAULT_TIMEOUT = 60.0
+
+_STATS_WINDOW = 100
+
+# Chave de response_metadata com o modelo (chave de MODEL_CONFIGS) que de fato respondeu
+ANSWERED_BY = "answered_by"
+
+
+class ModelStats:
+    """Latencias e erros recentes de um modelo."""
+
+    def __init__(self, window: int = _STATS_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_errors = 0
+            else:
+                self.consecutive_errors += 1
+                if self.consecutive_errors >= LLM_MAX_CONSECUTIVE_ERRORS:
+                    self.cooldown_until = time.monotonic() + LLM_COOLDOWN_SECONDS
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        with self._lock:
+            latencies = list(self.latencies)
+        return {
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate(), 3),
+            "avg_latency": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+            "available": self.available(),
+        }
+
+
+def answered_by(response: Any) -> Optional[str]:
+    """Modelo que respondeu uma chamada feita pelo ModelRouter (pode ser um fallback), ou None."""
+    metadata = getattr(response, "response_metadata", None) or {}
+    return metadata.get(ANSWERED_BY)
+
+
+def _tag(response: AIMessage, key: str) -> AIMessage:
+    response.response_metadata[ANSWERED_BY] = key
+    return response
+
+
+def _is_valid(response: Any) -> bool:
+    """Resposta utilizavel: tool calls ou texto."""
+    return isinstance(response, AIMessage) and bool(response.tool_calls or response.content)
+
+
+class ModelRouter:
+    """
+    Escolhe o modelo de cada chamada entre o principal e os fallbacks.
+
+    - Modelos com erros seguidos saem de rotacao por LLM_COOLDOWN_SECONDS.
+    - Cada chamada tem o timeout do provedor; erro, timeout ou resposta vazia
+      passam para o proximo modelo da lista.
+    - Com hedging, se o principal passar do seu p95 o primeiro fallback e
+      disparado em paralelo e vale a primeira resposta valida.
+    """
+
+    def __init__(
+            self,
+            primary: str = LLM,
+            fallbacks: Optional[List[str]] = None,
+            hedging: bool = LLM_HEDGING,
+    ):
+        self.primary = primary
+        self.fallbacks = LLM_FALLBACKS if fallbacks is None else fallbacks
+        self.hedging = hedging
+        self._stats: Dict[str, ModelStats] = {}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=LLM_ROUTER_WORKERS, thread_name_prefix="llm")
+
+    def bind(self, toolset, llm: Mapping[str, Any] = models, model_key: Optional[str] = None) -> "RoutedModel":
+        """Equivalente a toolset.bind(llm, key), com failover entre os modelos."""
+        return RoutedModel(self, toolset, llm, model_key or self.primary)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {key: stats.snapshot() for key, stats in self._stats.items()}
+
+    def complete(self, llm: Mapping[str, Any], key: str, messages: List[BaseMessage]) -> AIMessage:
+        """Chamada sem tools (ex.: resumos), respeitando o limite e a prioridade do provedor."""
+        started = time.monotonic()
+        try:
+            response = _invoke_limited(llm[key], messages, self.limiter(llm, key), current_priority(),
+                                       self.call_timeout(llm, key))
+        except Exception:
+            self.model_stats(key).record(time.monotonic() - started, ok=False)
+            raise
+        self.model_stats(key).record(time.monotonic() - started, ok=True)
+        return response
+
+    def model_stats(self, key: str) -> ModelStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._stats_lock:
+                stats = self._stats.setdefault(key, ModelStats())
+        return stats
+
+    def candidates(self, primary: str) -> List[str]:
+        keys = list(dict.fromkeys([primary, *self.fallbacks]))
+        available = [key for key in keys if self.model_stats(key).available()]
+        # Todos fora de rotacao: tenta mesmo assim, na ordem configurada
+        return available or keys
+
+    def limiter(self, llm: Mapping[str, Any], key: str) -> Optional[AdaptiveLimiter]:
+        get_config = getattr(llm, "get_config", None)
+        provider = get_config(key).get("provider") if get_config else None
+        return provider_limiter(provider) if provider else None
+
+    def timeout(self, llm: Mapping[str, Any], key: str) -> float:
+        get_config = getattr(llm, "get_config", None)
+        config = get_config(key) if get_config else {}
+        return config.get("timeout") or PROVIDER_TIMEOUTS.get(config.get("provider"), DEFAULT_TIMEOUT)
+
+    def call_timeout(self, llm: Mapping[str, Any], key: str) -> float:
+        """Timeout do provedor, limitado ao que resta do deadline do contexto (ver llm_deadline)."""
+        remaining = remaining_time()
+        timeout = self.timeout(llm, key)
+        return timeout if remaining is None else max(0.0, min(timeout, remaining))
+
+    @staticmethod
+    def _out_of_time(errors: Dict[str, str]) -> bool:
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            errors["deadline"] = "run deadline reached"
+            return True
+        return False
+
+    def hedge_delay(self, keys: List[str]) -> Optional[float]:
+        if not self.hedging or len(keys) < 2:
+            return None
+        return self.model_stats(keys[0]).p95()
+
+    # --- Chamadas sincronas ---
+
+    def invoke(self, toolset, llm: Mapping[str, Any], primary: str, messages: List[BaseMessage]) -> AIMessage:
+        keys = self.candidates(primary)
+        errors: Dict[str, str] = {}
+        futures = {}
+        for index, key in enumerate(keys):
+            if self._out_of_time(errors):
+                break
+            futures[self._submit(toolset, llm, key, messages)] = key
+            delay = self.hedge_delay(keys) if index == 0 else None
+            response = self._wait_first_valid(futures, errors, llm, hedge_delay=delay)
+            if response is not None:
+                return response
+        raise LLMUnavailableError(errors, f"No model answered: {errors}")
+
+    def _submit(self, toolset, llm, key: str, messages: List[BaseMessage]):
+        bound = toolset.bind(llm, key)
+        started = time.monotonic()
+        # O contexto (prioridade) nao passa para a thread do pool: vai como argumento
+        timeout = self.call_timeout(llm, key)
+        future = self._executor.submit(
+            _invoke_limited, bound, messages, self.limiter(llm, key), current_priority(), timeout
+        )
+        future.started = started
+        future.timeout = timeout
+        return future
+
+    def _wait_first_valid(self, futures: dict, errors: Dict[str, str], llm, hedge_delay: Optional[float]):
+        """Aguarda as chamadas pendentes; retorna None quando e hora de tentar o proximo modelo."""
+        while futures:
+            now = time.monotonic()
+            deadlines = {future: future.started + future.timeout for future in futures}
+            wait_for = max(0.0, min(deadlines.values()) - now)
+            if hedge_delay is not None:
+                wait_for = min(wait_for, hedge_delay)
+            done, _ = wait(list(futures), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                key = futures.pop(future)
+                latency = time.monotonic() - future.started
+                try:
+                    response = future.result()
+                except Exception as e:
+                    self.model_stats(key).record(latency, ok=False)
+                    errors[key] = repr(e)
+                    continue
+                if not _is_valid(response):
+                    self.model_stats(key).record(latency, ok=False)
+                    errors[key] = "empty response"
+                    continue
+                self.model_stats(key).record(latency, ok=True)
+                for pending in futures:
+                    pending.cancel()
+                return _tag(response, key)
+
+            now = time.monotonic()
+            for future, key in list(futures.items()):
+                if now >= deadlines[future]:
+                    # A thread nao pode ser interrompida; o resultado e descartado
+                    futures.pop(future)
+                    errors[key] = "timeout"
+                    if future.timeout < self.timeout(llm, key):
+                        # Cortada pelo deadline da execucao, nao pelo provedor: nao conta como falha dele
+                        continue
+                    self.model_stats(key).record(now - future.started, ok=False)
+                    limiter = self.limiter(llm, key)
+                    if limiter is not None:
+                        limiter.record(overloaded=True, started=future.started)
+
+            if not done and hedge_delay is not None:
+                # Principal passou do p95: o proximo modelo corre em paralelo
+                return None
+            if not futures:
+                return None
+        return None
+
+    # --- Chamadas assincronas ---
+
+    async def ainvoke(self, toolset, llm: Mapping[str, Any], primary: str, messages: List[BaseMessage]) -> AIMessage:
+        keys = self.candidates(primary)
+        errors: Dict[str, str] = {}
+        tasks: Dict[asyncio.Task, str] = {}
+        try:
+            for index, key in enumerate(keys):
+                if self._out_of_time(errors):
+                    break
+                tasks[asyncio.ensure_future(self._acall(toolset, llm, key, messages))] = key
+                delay = self.hedge_delay(keys) if index == 0 else None
+                response = await self._await_first_valid(tasks, errors, hedge_delay=delay)
+                if response is not None:
+                    return response
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise LLMUnavailableError(errors, f"No model answered: {errors}")
+
+    async def _acall(self, toolset, llm, key: str, messages: List[BaseMessage]) -> AIMessage:
+        bound = toolset.bind(llm, key)
+        limiter = self.limiter(llm, key)
+        started = time.monotonic()
+        timeout = self.call_timeout(llm, key)
+        try:
+            response = await asyncio.wait_for(
+                _ainvoke_limited(bound, messages, limiter, current_priority()), timeout=timeout
+            )
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            if timeout < self.timeout(llm, key):
+                # Cortada pelo deadline da execucao, nao pelo provedor: nao conta como falha dele
+                raise TimeoutError("run deadline reached")
+            self.model_stats(key).record(time.monotonic() - started, ok=False)
+            if limiter is not None:
+                limiter.record(overloaded=True, started=started)
+            raise TimeoutError("timeout")
+        except Exception:
+            self.model_stats(key).record(time.monotonic() - started, ok=False)
+            raise
+        ok = _is_valid(response)
+        self.model_stats(key).record(time.monotonic() - started, ok=ok)
+        if not ok:
+            raise ValueError("empty response")
+        return _tag(response, key)
+
+    async def _await_first_valid(self, tasks: Dict[asyncio.Task, str], errors: Dict[str, str],
+                                 hedge_delay: Optional[float]):
+        while tasks:
+            done, _ = await asyncio.wait(list(tasks), timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Principal passou do p95: o proximo modelo corre em paralelo
+                return None
+            for task in done:
+                key = tasks.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                errors[key] = repr(task.exception())
+            if hedge_delay is not None:
+                return None
+        return None
+
+
+def _invoke_limited(bound, messages: List[BaseMessage], limiter: Optional[AdaptiveLimiter],
+                    priority: Priority, timeout: float) -> AIMessage:
+    if limiter is None:
+        return bound.invoke(messages)
+    if not limiter.acquire(priority, timeout=timeout):
+        raise TimeoutError(f"No {limiter.name} capacity within {timeout}s")
+    started = time.monotonic()
+    try:
+        response = bound.invoke(messages)
+    except Exception as e:
+        limiter.record(overloaded=is_overload_error(e), started=started)
+        raise
+    finally:
+        limiter.release()
+    limiter.record(overloaded=False)
+    return response
+
+
+async def _ainvoke_limited(bound, messages: List[BaseMessage], limiter: Optional[AdaptiveLimiter],
+                           priority: Priority) -> AIMessage:
+    if limiter is None:
+        return await bound.ainvoke(messages)
+    await limiter.acquire_async(priority)
+    started = time.monotonic()
+    try:
+        response = await bound.ainvoke(messages)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        limiter.record(overloaded=is_overload_error(e), started=started)
+        raise
+    finally:
+        limiter.release()
+    limiter.record(overloaded=False)
+    return response
+
+
+class RoutedModel:
+    """Runnable minimo (invoke/ainvoke) devolvido por ModelRouter.bind."""
+
+    def __init__(self, router: ModelRouter, toolset, llm: Mapping[str, Any], primary: str):
+        self.router = router
+        self.toolset = toolset
+        self.llm = llm
+        self.primary = primary
+
+    def invoke(self, messages: List[BaseMessage]) -> AIMessage:
+        return self.router.invoke(self.toolset, self.llm, self.primary, messages)
+
+    async def ainvoke(self, messages: List[BaseMessage]) -> AIMessage:
+        return await self.router.ainvoke(self.toolset, self.llm, self.primary, messages)
+
+
+model_router = ModelRouter()
@@ -0,0 +1,126 @@
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Mapping, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+# auto (tiktoken se instalado, senao estimativa por caracteres) | tiktoken | chars
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "auto")
+TIKTOKEN_ENCODING = os.getenv("TIKTOKEN_ENCODING", "cl100k_base")
+# Janela usada quando o modelo nao declara "context_window" em MODEL_CONFIGS
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "8192"))
+# Tokens reservados para a resposta quando o modelo nao declara "max_tokens"
+RESPONSE_TOKEN_RESERVE = int(os.getenv("RESPONSE_TOKEN_RESERVE", "1024"))
+
+# Custo fixo aproximado de cada mensagem (papel, separadores)
+MESSAGE_OVERHEAD = 4
+
+
+class Tokenizer(ABC):
+    """Conta e corta textos em tokens."""
+
+    name = "base"
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        pass
+
+    @abstractmethod
+    def truncate(self, text: str, max_tokens: int) -> str:
+        pass
+
+
+class CharTokenizer(Tokenizer):
+    """Estimativa sem dependencias: ~4 caracteres por token (ingles/portugues)."""
+
+    name = "chars"
+
+    def __init__(self, chars_per_token: float = 4.0):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text[:int(max_tokens * self.chars_per_token)]
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Contagem exata para modelos OpenAI; boa aproximacao para os demais."""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding: str = TIKTOKEN_ENCODING):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode(text, disallowed_special=())
+        return self._encoding.decode(tokens[:max_tokens])
+
+
+def create_tokenizer(kind: str = TOKEN_COUNTER) -> Tokenizer:
+    if kind == "chars":
+        return CharTokenizer()
+    if kind == "tiktoken":
+        return TiktokenTokenizer()
+    if kind == "auto":
+        try:
+            return TiktokenTokenizer()
+        except Exception:
+            # tiktoken e opcional (ou nao conseguiu baixar o encoding)
+            return CharTokenizer()
+    raise ValueError(f"Contador de tokens nao suportado: {kind}. Use 'auto', 'tiktoken' ou 'chars'.")
+
+
+_tokenizer: Optional[Tokenizer] = None
+
+
+def get_tokenizer() -> Tokenizer:
+    """Tokenizer padrao, criado no primeiro uso (tiktoken pode baixar o encoding)."""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = create_tokenizer()
+    return _tokenizer
+
+
+def message_text(message: BaseMessage) -> str:
+    """Texto que o provedor recebe de uma mensagem: conteudo + tool calls serializados."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, default=str)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        calls = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+        content += json.dumps(calls, default=str, ensure_ascii=False)
+    return content
+
+
+def count_message_tokens(message: BaseMessage, counter: Tokenizer = None) -> int:
+    return (counter or get_tokenizer()).count(message_text(message)) + MESSAGE_OVERHEAD
+
+
+def count_tokens(messages: Sequence[BaseMessage], counter: Tokenizer = None) -> int:
+    return sum(count_message_tokens(message, counter) for message in messages)
+
+
+def context_window(llm: Mapping[str, Any], model_key: str) -> int:
+    get_config = getattr(llm, "get_config", None)
+    try:
+        config = get_config(model_key) if get_config else {}
+    except KeyError:
+        config = {}
+    return config.get("context_window") or DEFAULT_CONTEXT_WINDOW
+
+
+def prompt_budget(llm: Mapping[str, Any], model_key: str, limit: Optional[int] = None) -> int:
+    """Tokens disponiveis para o prompt: janela do modelo - reserva da resposta (e no maximo limit)."""
+    get_config = getattr(llm, "get_config", None)
+    try:
+        reserve = (get_config(model_key) if get_config else {}).get("max_tokens") or RESPONSE_TOKEN_RESERVE
+    except KeyError:
+        reserve = RESPONSE_TOKEN_RESERVE
+    budget = context_window(llm, model_key) - reserve
+    return min(budget, limit) if limit else budget
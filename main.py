@@ -2,22 +2,33 @@
 
 import json
 import logging
+from contextlib import asynccontextmanager
 import os
 import sys
 from pathlib import Path
 import time
 import threading
-from typing import Any, Dict
-from typing_extensions import Annotated
+from typing import Any, Dict, List
 import uvicorn
 from dotenv import load_dotenv
 _ = load_dotenv() # forcar a execucao
 
-from app.schema import Payload, Message, Audio, Image, User
+from app.schema import Payload, Message, Audio, Image
 from app.domain import message_service
+from app.domain.user_directory import user_directory
+from app.domain.exceptions import QueueFullError
+from app.infrastructure.job_queue import job_queue
+from app.infrastructure.dedup import seen_messages
+from app.infrastructure.llm import LLM_PRELOAD, limiter_stats, models
+from app.infrastructure.llm_cache import response_cache
+from app.infrastructure.answer_cache import answer_cache
+from app.infrastructure.model_router import model_router
+from app.domain.message_coalescer import message_coalescer
+from app.domain.agents.recovery import recovery_stats
 
 
-from fastapi import FastAPI, Query, HTTPException, Depends, Request, BackgroundTasks
+from fastapi import FastAPI, Query, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 # Add the project root to Python path
 project_root = Path(__file__).parent.parent
@@ -27,6 +38,18 @@ IS_DEV_ENVIRONMENT = True
 DEBUG = True
 VERIFICATION_TOKEN = os.getenv("VERIFICATION_TOKEN")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(models.preload, LLM_PRELOAD)
+    # Indice de usuarios montado antes da primeira mensagem; recargas rodam em thread propria
+    await run_in_threadpool(user_directory.load)
+    await job_queue.start()
+    yield
+    await message_coalescer.stop()
+    await job_queue.stop()
+
+
 app = FastAPI(
     title="WhatsApp Bot",
     version="0.1.0",
@@ -34,11 +57,13 @@ app = FastAPI(
     docs_url=f"/docs" if IS_DEV_ENVIRONMENT else None,
     redoc_url=f"/redoc" if IS_DEV_ENVIRONMENT else None,
     swagger_ui_oauth2_redirect_url=f"/docs/oauth2-redirect" if IS_DEV_ENVIRONMENT else None,
+    lifespan=lifespan,
 )
 
 log = logging.getLogger(__name__)
 
 MESSAGE_EXPIRY_MINUTES = 5  # Mensagens mais antigas que 5 minutos são descartadas
+QUEUE_FULL_RETRY_AFTER_SECONDS = 5
 
 def is_message_too_old(message_timestamp, max_age_minutes=MESSAGE_EXPIRY_MINUTES):
     """
@@ -68,30 +93,59 @@ def is_message_too_old(message_timestamp, max_age_minutes=MESSAGE_EXPIRY_MINUTES
     
     return age_minutes > max_age_minutes
 
-def parse_message(payload: Payload) -> Message | None:
-    if not payload.entry[0].changes[0].value.messages:
+def message_deadline(message_timestamp, max_age_minutes=MESSAGE_EXPIRY_MINUTES) -> float | None:
+    """Timestamp (epoch) a partir do qual a mensagem deixa de valer a pena ser respondida."""
+    try:
+        return float(message_timestamp) + max_age_minutes * 60
+    except (ValueError, TypeError):
         return None
-    return payload.entry[0].changes[0].value.messages[0]
 
-def get_current_user(message: Annotated[Message, Depends(parse_message)]) -> User | None:
-    if not message:
-        return None
-    return message_service.authenticate_user_by_phone_number(message.from_)
+def extract_message_ids(data: Dict[Any, Any]) -> List[str]:
+    """Le apenas os ids das mensagens do JSON cru, sem validar o Payload inteiro."""
+    ids = []
+    try:
+        for entry in data.get("entry") or []:
+            for change in entry.get("changes") or []:
+                for message in (change.get("value") or {}).get("messages") or []:
+                    if message.get("id"):
+                        ids.append(message["id"])
+    except AttributeError:
+        # Payload malformado: deixa a validacao do Payload reportar o erro
+        return []
+    return ids
+
+def parse_messages(payload: Payload) -> List[Message]:
+    """Todas as mensagens do payload, na ordem de entrega (Meta agrupa varias em uma entrega)."""
+    return [
+        message
+        for entry in payload.entry
+        for change in entry.changes
+        for message in (change.value.messages or [])
+    ]
 
-def parse_audio_file(message: Annotated[Message, Depends(parse_message)]) -> Audio | None:
+def group_messages_by_sender(messages: List[Message]) -> Dict[str, List[Message]]:
+    grouped: Dict[str, List[Message]] = {}
+    for message in messages:
+        grouped.setdefault(message.from_, []).append(message)
+    return grouped
+
+def _rejection(message: Message, status_code: int, detail: Any, headers: Dict[str, str] | None = None) -> Dict[str, Any]:
+    rejection = {"id": message.id, "status_code": status_code, "detail": detail}
+    if headers:
+        rejection["headers"] = headers
+    return rejection
+
+def parse_audio_file(message: Message) -> Audio | None:
     if message and message.type == "audio":
         return message.audio
     return None
 
-def parse_image_file(message: Annotated[Message, Depends(parse_message)]) -> Image | None:
+def parse_image_file(message: Message) -> Image | None:
     if message and message.type == "image":
         return message.image
     return None
 
-def message_extractor(
-        message: Annotated[Message, Depends(parse_message)],
-        audio: Annotated[Audio, Depends(parse_audio_file)],
-):
+def message_extractor(message: Message, audio: Audio | None):
     if audio:
         return message_service.transcribe_audio(audio)
     if message and message.text:
@@ -107,7 +161,16 @@ def health():
 
 @app.get("/readiness")
 def readiness():
-    return {"status": "ready"}
+    return {
+        "status": "ready",
+        "job_queue": job_queue.stats(),
+        "coalescer": message_coalescer.stats(),
+        "llm_cache": response_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "models": model_router.stats(),
+        "llm_limiters": limiter_stats(),
+        "tool_call_recovery": recovery_stats(),
+    }
 
 @app.get("/webhook")
 def verify_whatsapp(
@@ -121,54 +184,130 @@ def verify_whatsapp(
     raise HTTPException(status_code=403, detail="Invalid verification token")
 
 @app.post('/webhook', status_code=200)
-def whatsapp_webhook(data: Dict[Any, Any], background_tasks: BackgroundTasks):
+async def whatsapp_webhook(data: Dict[Any, Any]):
     """
     Endpoint para receber webhooks do WhatsApp
+
+    Processa todas as mensagens do payload (todas as entries/changes), agrupadas
+    por remetente: uma autenticacao por remetente, e as mensagens seguem para o
+    coalescer, que junta rajadas do mesmo usuario em uma unica execucao do agente.
     """
     start_time = time.time()
 
+    # Retentativas da Meta: descarta ids ja vistos antes de qualquer outro parsing
+    message_ids = extract_message_ids(data)
+    new_ids = {message_id for message_id in message_ids if seen_messages.add_if_new(message_id)}
+    if message_ids and not new_ids:
+        return {"status": "duplicate", "ids": message_ids}
+
     if DEBUG:
         print("Received WhatsApp message:\n", json.dumps(data, indent=2))
     
     payload = Payload(**data)
-    message = parse_message(payload=payload)
-    user = get_current_user(message)
-    audio = parse_audio_file(message)
-    user_message = message_extractor(message, audio)
-    image = parse_image_file(message)
+    messages = [message for message in parse_messages(payload=payload) if message.id in new_ids]
 
-    if not user and not user_message and not image:
+    if not messages:
         # status message
         return {"status": "ok"}
 
-    if message and is_message_too_old(message.timestamp):
-        raise HTTPException(status_code=422, detail={
-            "error": "message_expired",
-            "message": "Message is too old to be processed",
-            "max_age_minutes": MESSAGE_EXPIRY_MINUTES
-        })
-        
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    if not user_message and not image:
-        raise HTTPException(status_code=400, detail="No message content found")
-    
-    if image:
-        return print("Image received")
-
-    if user_message:
-        print(f"Received message from user {user.first_name} {user.last_name} ({user.phone})")
-        background_tasks.add_task(message_service.respond_and_send_message, user_message, user)
-        return {
-            "status": "accepted", 
-            "type": message.type,
-            "user_phone": user.phone,
-            "processing_time_ms": round((time.time() - start_time) * 1000, 2)
-        }
-
-    # Fallback (não deveria chegar aqui)
-    return {"status": "no_action_taken"}
+    accepted = []
+    rejected = []
+    images = 0
+
+    for phone, sender_messages in group_messages_by_sender(messages).items():
+        # Lookup O(1) em memoria (diretorio indexado por telefone), seguro para o event loop
+        user = message_service.authenticate_user_by_phone_number(phone)
+        batch = []
+
+        for message in sender_messages:
+            audio = parse_audio_file(message)
+            image = parse_image_file(message)
+
+            if not user and not message.text and not audio and not image:
+                # status message
+                continue
+
+            if is_message_too_old(message.timestamp):
+                rejected.append(_rejection(message, 422, {
+                    "error": "message_expired",
+                    "message": "Message is too old to be processed",
+                    "max_age_minutes": MESSAGE_EXPIRY_MINUTES
+                }))
+                continue
+
+            if not user:
+                rejected.append(_rejection(message, 404, "User not found"))
+                continue
+
+            user_message = await run_in_threadpool(message_extractor, message, audio)
+
+            if not user_message and not image:
+                rejected.append(_rejection(message, 400, "No message content found"))
+                continue
+
+            if image:
+                print("Image received")
+                images += 1
+                continue
+
+            batch.append((message, user_message))
+
+        if not batch:
+            continue
+
+        print(f"Received {len(batch)} message(s) from user {user.first_name} {user.last_name} ({user.phone})")
+        try:
+            message_coalescer.add(
+                user,
+                [user_message for _, user_message in batch],
+                deadline=max(message_deadline(message.timestamp) for message, _ in batch),
+            )
+        except QueueFullError as e:
+            # Permite que a proxima entrega da Meta processe estas mensagens
+            for message, _ in batch:
+                seen_messages.discard(message.id)
+            rejected.extend(
+                _rejection(message, 503, {
+                    "error": "queue_full",
+                    "message": "Too many messages being processed, try again later",
+                    "max_queue_size": e.max_size,
+                }, headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_SECONDS)})
+                for message, _ in batch
+            )
+            continue
+
+        accepted.extend({"id": message.id, "type": message.type, "user_phone": user.phone} for message, _ in batch)
+
+    queue_full = [r for r in rejected if r["status_code"] == 503]
+    if queue_full:
+        # Uma entrega com 200 nao e reenviada pela Meta: pede a retentativa. Os ids aceitos
+        # continuam no seen_messages, entao a proxima entrega processa so os rejeitados.
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": "queue_full",
+                "message": "Too many messages being processed, try again later",
+                "accepted": accepted,
+                "rejected": [{k: v for k, v in r.items() if k != "headers"} for r in rejected],
+            },
+            headers=queue_full[0]["headers"],
+        )
+
+    if not accepted and not images:
+        if rejected:
+            # Nada foi aceito: mantem o mesmo erro HTTP do fluxo de uma mensagem
+            first = rejected[0]
+            raise HTTPException(status_code=first["status_code"], detail=first["detail"], headers=first.get("headers"))
+        # status message
+        return {"status": "ok"}
+
+    return {
+        "status": "accepted",
+        "accepted": accepted,
+        "rejected": [{k: v for k, v in r.items() if k != "headers"} for r in rejected],
+        "images": images,
+        "processing_time_ms": round((time.time() - start_time) * 1000, 2)
+    }
 
 if __name__ == "__main__":
     # noinspection PyTypeChecker